@@ -4,9 +4,57 @@ CREATOR_ID = 5791171535
 GROQ_API_KEY = "тут вставлю"
 GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
 MODEL_NAME = "mixtral-8x7b-32768"
+GROQ_MAX_CONNECTIONS = 20  # keep-alive соединений к API
+GROQ_CONNECT_TIMEOUT = 5  # секунд на установку соединения
+GROQ_READ_TIMEOUT = 60  # секунд ожидания ответа модели
+LLM_CONCURRENCY = 4  # одновременных запросов к модели
+LLM_RPM = 30  # лимит запросов в минуту
+LLM_TPM = 15000  # лимит токенов в минуту
+LLM_RESPONSE_TOKENS = 400  # оценка длины ответа для бюджета токенов
+RESPONSE_CACHE_TTL = 6 * 3600  # секунд жизни закэшированного ответа
+RESPONSE_CACHE_SIZE = 5000  # ответов в памяти (LRU)
+RESPONSE_CACHE_PERSIST = True  # второй уровень кэша в SQLite
+STREAM_EDIT_INTERVAL = 1.0  # секунд между правками сообщения при потоковом ответе
 
 DB_PATH = "data/database.db"
+DB_POOL_SIZE = 4  # соединений в пуле БД
+DB_BUSY_TIMEOUT_MS = 5000  # ожидание блокировки записи
 LOG_PATH = "data/bot.log"
+MEDIA_DIR = "data/media"  # картинки рекламы по хэшу содержимого
 
 AD_LIMIT_PER_CHAT = 1  # рекламных поста в час на чат
-ACTIVITY_THRESHOLD = 1000  # сообщений для прожарки
\ No newline at end of file
+AD_CONCURRENCY = 10  # одновременных отправок рекламы
+OUTBOX_GLOBAL_RATE = 30  # исходящих сообщений в секунду на всего бота
+OUTBOX_GROUP_PER_MIN = 20  # сообщений в минуту в одну группу
+OUTBOX_PRIVATE_RATE = 1  # сообщений в секунду в один личный чат
+OUTBOX_MAX_CHATS = 50000  # лимитов чатов в памяти (LRU)
+ACTIVITY_THRESHOLD = 1000  # сообщений для прожарки
+CONFLICT_COOLDOWN = 300  # секунд тишины после вмешательства в конфликт
+ANTIMAT_WORDS_PATH = "data/antimat.txt"  # свой словарь антимата (по основе в строке)
+
+INGEST_BATCH_SIZE = 500  # строк в одной транзакции записи сообщений
+INGEST_FLUSH_MS = 250  # максимальная задержка записи сообщений
+INGEST_MAX_RETRIES = 5  # неудачных записей пакета подряд, после которых он отбрасывается
+LEADERBOARD_MAX_CHATS = 1000  # чатов с рейтингом в памяти (LRU)
+USER_CACHE_SIZE = 200000  # имён пользователей в памяти (LRU)
+PROFILE_CACHE_SIZE = 50000  # анкет ЛС в памяти (LRU)
+CONTEXT_SIZE = 20  # реплик диалога, хранимых на чат
+CONTEXT_CACHE_CHATS = 10000  # чатов с контекстом в памяти (LRU)
+CONTEXT_TOKEN_BUDGET = 2000  # токенов на весь промпт ассистента
+CONTEXT_WINDOW_TOKENS = 1200  # токенов последних реплик дословно; старшие — в резюме
+CONTEXT_SUMMARY_TOKENS = 250  # длина резюме старой части диалога
+CONTEXT_SUMMARY_RETRY = 120  # секунд паузы после неудачной попытки резюме
+TRANSCRIPT_TOKENS = 1500  # токенов переписки в промптах прожарок и характеристик
+TRANSCRIPT_MESSAGE_CHARS = 200  # символов одного сообщения в переписке
+CHAT_SUMMARY_EVERY = 200  # сообщений чата на один фоновый конспект для прожарки
+HISTORY_RETENTION_DAYS = 30  # дней истории сообщений в БД (по умолчанию для чата)
+RETENTION_INTERVAL = 3600  # секунд между запусками архивации
+RETENTION_CHUNK = 2000  # строк за одну транзакцию архивации
+RETENTION_VACUUM_PAGES = 1000  # страниц, освобождаемых за проход incremental_vacuum
+ARCHIVE_DIR = "data/archive"  # архив истории: <чат>/<дата>.jsonl.gz
+
+FLOOD_LIMIT = 5  # стикеров/гифок подряд до мута
+SPAM_REPEAT_LIMIT = 3  # одинаковых сообщений до мута
+SPAM_WINDOW_SEC = 600  # окно поиска повторов
+MODERATION_IDLE_TTL = 1800  # секунд до вытеснения состояния неактивного пользователя
+MODERATION_MAX_USERS = 100000  # максимум отслеживаемых пар (чат, пользователь)
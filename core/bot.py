@@ -5,6 +5,13 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from config import CREATOR_ID
 from utils.logger import logger
+from services.ai_client import groq_client
+from core.security import permissions
+from services.settings import chat_settings
+from services.rollups import backfill_rollups
+from services.chats import backfill_chats
+from services.retention import history_retention
+from services.outbox import outbox, SendPriority
 
 # Получаем токен из переменных окружения
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -29,12 +36,23 @@ dp = Dispatcher(storage=storage)
 async def on_startup():
     """Действия при запуске бота"""
     logger.info("Бот запускается...")
+    await groq_client.start()
+    await permissions.warm()
+    logger.info(f"Загружено прав админов: {len(permissions)}")
+    await chat_settings.load()
+    logger.info(f"Загружено настроек чатов: {len(chat_settings)}")
+    await backfill_rollups()
+    await backfill_chats()
+    # Архивации нужны сроки хранения чатов и заполненный реестр чатов
+    history_retention.start()
     try:
-        await bot.send_message(
-            CREATOR_ID,
+        me = await bot.me()
+        await outbox.send_message(
+            bot, CREATOR_ID,
             "🤖 Бот запущен!\n"
-            f"ID: {(await bot.me()).id}\n"
-            f"Username: @{(await bot.me()).username}"
+            f"ID: {me.id}\n"
+            f"Username: @{me.username}",
+            SendPriority.NOTICE
         )
         logger.info("Уведомление создателю отправлено")
     except Exception as e:
@@ -43,12 +61,17 @@ async def on_startup():
 async def on_shutdown():
     """Действия при остановке бота"""
     logger.info("Бот останавливается...")
+    await groq_client.close()
     await bot.session.close()
     logger.info("Сессия закрыта")
 
 def setup_dispatcher():
     """Настройка диспетчера с роутерами"""
     from handlers import admin, user, chat_monitor, personal, advertising
+    from core.middlewares import UserDirectoryMiddleware
+    
+    # Справочник пользователей пополняется из каждого апдейта
+    dp.update.outer_middleware(UserDirectoryMiddleware())
     
     # Включаем все роутеры
     dp.include_router(admin.router)
@@ -0,0 +1,12 @@
+from aiogram import BaseMiddleware
+from services.users import user_directory
+
+
+class UserDirectoryMiddleware(BaseMiddleware):
+    """Запоминает отправителя каждого апдейта в справочнике пользователей"""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is not None:
+            user_directory.observe(user)
+        return await handler(event, data)
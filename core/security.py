@@ -1,12 +1,40 @@
-import sqlite3
-from config import DB_PATH, CREATOR_ID
-
-def check_admin_level(user_id: int, required_level: int) -> bool:
-    if user_id == CREATOR_ID:
-        return True
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT level FROM admins WHERE user_id=?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return row and row[0] >= required_level
\ No newline at end of file
+from config import CREATOR_ID
+from data.database import db
+
+
+class PermissionService:
+    """Уровни админов по (чат, пользователь) в памяти.
+
+    Кэш загружается целиком при старте и обновляется при каждом назначении,
+    поэтому проверка прав не обращается к диску.
+    """
+
+    def __init__(self):
+        self._levels = {}  # (chat_id, user_id): level
+
+    async def warm(self):
+        """Загрузить всех админов (вызывается в on_startup)"""
+        rows = await db.fetchall("SELECT chat_id, user_id, level FROM admins")
+        self._levels = {(chat_id, user_id): level for chat_id, user_id, level in rows}
+
+    def get_level(self, chat_id: int, user_id: int) -> int:
+        if user_id == CREATOR_ID:
+            return 3
+        return self._levels.get((chat_id, user_id), 0)
+
+    async def set_level(self, chat_id: int, user_id: int, level: int, appointed_by: int = None):
+        """Назначить уровень: запись в БД и сразу в кэш"""
+        await db.execute("""INSERT OR REPLACE INTO admins (user_id, chat_id, level, appointed_by)
+                            VALUES (?, ?, ?, ?)""",
+                         (user_id, chat_id, level, appointed_by))
+        self._levels[(chat_id, user_id)] = level
+
+    def __len__(self):
+        return len(self._levels)
+
+
+# Глобальный экземпляр
+permissions = PermissionService()
+
+async def check_admin_level(user_id: int, required_level: int, chat_id: int) -> bool:
+    return permissions.get_level(chat_id, user_id) >= required_level
@@ -1,6 +1,7 @@
 # Инициализация базы данных при импорте
 from .models import init_database, add_user
+from .database import db, Database
 
 init_database()
 
-__all__ = ['init_database', 'add_user']
\ No newline at end of file
+__all__ = ['init_database', 'add_user', 'db', 'Database']
\ No newline at end of file
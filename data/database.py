@@ -0,0 +1,113 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from config import DB_PATH, DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS
+
+# Прагмы для каждого соединения пула
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",       # ~16 МБ страничного кэша
+    "PRAGMA mmap_size=134217728",     # 128 МБ memory-mapped I/O
+    f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}",
+)
+
+
+class Database:
+    """Асинхронный доступ к SQLite через ограниченный пул соединений.
+
+    Каждый запрос выполняется в отдельном потоке пула, поэтому медленный
+    запрос или fsync не блокирует event loop бота.
+    """
+
+    def __init__(self, path: str = DB_PATH, pool_size: int = DB_POOL_SIZE):
+        self.path = path
+        self.pool_size = pool_size
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="db")
+        self._pool = None  # asyncio.Queue с соединениями, создаётся лениво
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _get_pool(self) -> asyncio.Queue:
+        if self._pool is None:
+            self._pool = asyncio.Queue()
+            for _ in range(self.pool_size):
+                self._pool.put_nowait(None)  # соединения открываются по требованию
+        return self._pool
+
+    @asynccontextmanager
+    async def connection(self):
+        """Взять соединение из пула (ждёт, если все заняты)"""
+        pool = self._get_pool()
+        conn = await pool.get()
+        try:
+            if conn is None:
+                conn = await self._run(self._connect)
+            yield conn
+        finally:
+            pool.put_nowait(conn)
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def run(self, fn, *args, write: bool = True):
+        """Выполнить fn(conn, *args) в одной транзакции на соединении из пула.
+
+        Пишущая транзакция берёт блокировку записи сразу (BEGIN IMMEDIATE):
+        иначе в WAL чтение с последующей записью падает с «database is locked»,
+        если между ними закоммитило другое соединение, и busy_timeout не спасает.
+        """
+        async with self.connection() as conn:
+            return await self._run(_in_transaction, conn, fn, args, write)
+
+    # === Короткие запросы ===
+    async def execute(self, query: str, params: tuple = ()) -> sqlite3.Cursor:
+        """Выполнить запрос на запись; возвращает курсор (rowcount, lastrowid)"""
+        return await self.run(lambda conn: conn.execute(query, params))
+
+    async def executemany(self, query: str, seq_params) -> int:
+        cursor = await self.run(lambda conn: conn.executemany(query, seq_params))
+        return cursor.rowcount
+
+    async def fetchone(self, query: str, params: tuple = ()):
+        return await self.run(lambda conn: conn.execute(query, params).fetchone(), write=False)
+
+    async def fetchall(self, query: str, params: tuple = ()) -> list:
+        return await self.run(lambda conn: conn.execute(query, params).fetchall(), write=False)
+
+    async def fetchval(self, query: str, params: tuple = (), default=None):
+        """Первое значение первой строки"""
+        row = await self.fetchone(query, params)
+        return row[0] if row and row[0] is not None else default
+
+    async def close(self):
+        """Закрыть все соединения пула"""
+        if self._pool is not None:
+            for _ in range(self.pool_size):
+                conn = await self._pool.get()
+                if conn is not None:
+                    await self._run(conn.close)
+            self._pool = None
+        self._executor.shutdown(wait=False)
+
+
+def _in_transaction(conn: sqlite3.Connection, fn, args, write: bool):
+    conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+    try:
+        result = fn(conn, *args)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return result
+
+
+# Глобальный экземпляр
+db = Database()
@@ -1,4 +1,5 @@
 import sqlite3
+import json
 from datetime import datetime
 from pathlib import Path
 from config import DB_PATH
@@ -9,6 +10,11 @@ def init_database():
     Path("data").mkdir(exist_ok=True)
     
     conn = sqlite3.connect(DB_PATH)
+    # Для новой базы: место после архивации истории возвращается постранично
+    # (на существующей режим включится только после ручного VACUUM)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL сохраняется в файле БД — пул соединений читает параллельно с записью
+    conn.execute("PRAGMA journal_mode=WAL")
     c = conn.cursor()
     
     # === ПОЛЬЗОВАТЕЛИ ===
@@ -20,19 +26,9 @@ def init_database():
         created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )''')
     
-    # === ПРОФИЛИ ДЛЯ ЛС ===
-    c.execute('''CREATE TABLE IF NOT EXISTS personal_profiles (
-        user_id INTEGER PRIMARY KEY,
-        language TEXT DEFAULT 'ru',
-        country TEXT,
-        interests TEXT,
-        expertise TEXT,
-        style TEXT DEFAULT 'neutral',
-        banned_topics TEXT,
-        timezone TEXT,
-        updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY(user_id) REFERENCES users(user_id)
-    )''')
+    # === ПРОФИЛИ ДЛЯ ЛС (списки — строкой через запятую) ===
+    _migrate_json_profiles(c)
+    c.execute(PROFILES_TABLE.format(name="personal_profiles"))
     
     # === АДМИНИСТРАТОРЫ ===
     c.execute('''CREATE TABLE IF NOT EXISTS admins (
@@ -60,6 +56,30 @@ def init_database():
     c.execute('''CREATE INDEX IF NOT EXISTS idx_chat_time 
                  ON chat_history(chat_id, timestamp DESC)''')
     
+    # === КОНСПЕКТЫ ПЕРЕПИСКИ (для прожарки чата) ===
+    c.execute('''CREATE TABLE IF NOT EXISTS chat_summaries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER,
+        from_id INTEGER,
+        to_id INTEGER,
+        summary TEXT,
+        created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_chat_summaries 
+                 ON chat_summaries(chat_id, to_id)''')
+    
+    # === РЕЕСТР ЧАТОВ (обновляется очередью сообщений) ===
+    c.execute('''CREATE TABLE IF NOT EXISTS chats (
+        chat_id INTEGER PRIMARY KEY,
+        type TEXT,
+        title TEXT,
+        first_seen TIMESTAMP,
+        last_seen TIMESTAMP,
+        messages INTEGER DEFAULT 0
+    )''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_chats_last_seen 
+                 ON chats(last_seen)''')
+    
     # === АКТИВНОСТЬ ===
     c.execute('''CREATE TABLE IF NOT EXISTS activity (
         user_id INTEGER,
@@ -70,6 +90,18 @@ def init_database():
         FOREIGN KEY(user_id) REFERENCES users(user_id)
     )''')
     
+    # === АГРЕГАТЫ АКТИВНОСТИ (сутки/неделя/месяц/всё время) ===
+    c.execute('''CREATE TABLE IF NOT EXISTS activity_rollups (
+        chat_id INTEGER,
+        user_id INTEGER,
+        period TEXT CHECK(period IN ('day', 'week', 'month', 'all')),
+        bucket TEXT,
+        messages INTEGER DEFAULT 0,
+        PRIMARY KEY(chat_id, period, bucket, user_id)
+    )''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_rollups_top 
+                 ON activity_rollups(chat_id, period, bucket, messages DESC)''')
+    
     # === МОДЕРАЦИЯ ===
     c.execute('''CREATE TABLE IF NOT EXISTS moderations (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -101,6 +133,13 @@ def init_database():
         PRIMARY KEY(target_id, chat_id)
     )''')
     
+    # === КЭШ ОТВЕТОВ НА ВОПРОСЫ ===
+    c.execute('''CREATE TABLE IF NOT EXISTS response_cache (
+        key TEXT PRIMARY KEY,
+        response TEXT,
+        expires REAL
+    )''')
+    
     # === РЕКЛАМНЫЕ ЗАДАЧИ ===
     c.execute('''CREATE TABLE IF NOT EXISTS ad_tasks (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -110,7 +149,17 @@ def init_database():
         total INTEGER DEFAULT 1,
         sent INTEGER DEFAULT 0,
         created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        status TEXT DEFAULT 'active' CHECK(status IN ('active', 'completed', 'cancelled'))
+        status TEXT DEFAULT 'active' CHECK(status IN ('active', 'completed', 'cancelled')),
+        file_id TEXT
+    )''')
+    _add_column(c, "ad_tasks", "file_id", "TEXT")
+    
+    # === МЕДИАФАЙЛЫ (по хэшу содержимого) ===
+    c.execute('''CREATE TABLE IF NOT EXISTS media_files (
+        sha256 TEXT PRIMARY KEY,
+        path TEXT,
+        file_id TEXT,
+        created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )''')
     
     # === ОЧЕРЕДЬ РЕКЛАМЫ ===
@@ -123,20 +172,63 @@ def init_database():
         error TEXT,
         FOREIGN KEY(task_id) REFERENCES ad_tasks(id) ON DELETE CASCADE
     )''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_ad_queue_task 
+                 ON ad_queue(task_id, chat_id)''')
     
     # === СИСТЕМНЫЕ НАСТРОЙКИ ===
     c.execute('''CREATE TABLE IF NOT EXISTS settings (
         chat_id INTEGER PRIMARY KEY,
         antimat BOOLEAN DEFAULT FALSE,
-        antiflood BOOLEAN DEFAULT FALSE,
+        antiflood BOOLEAN DEFAULT TRUE,
         last_roast_message INTEGER DEFAULT 0,
+        retention_days INTEGER,
         updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )''')
+    _add_column(c, "settings", "retention_days", "INTEGER")
     
     conn.commit()
     conn.close()
     print(f"[{datetime.now()}] База данных инициализирована: {DB_PATH}")
 
+PROFILES_TABLE = '''CREATE TABLE IF NOT EXISTS {name} (
+        user_id INTEGER PRIMARY KEY,
+        language TEXT DEFAULT 'ru',
+        country TEXT,
+        interests TEXT,
+        expertise TEXT,
+        style TEXT DEFAULT 'neutral',
+        banned_topics TEXT,
+        timezone TEXT,
+        updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(user_id)
+    )'''
+PROFILE_FIELDS = ("language", "country", "interests", "expertise", "style", "banned_topics", "timezone")
+
+def _migrate_json_profiles(c):
+    """Старые базы: анкета лежала JSON-ом в колонке data — раскладываем по колонкам"""
+    columns = {row[1] for row in c.execute("PRAGMA table_info(personal_profiles)")}
+    if "data" not in columns:
+        return
+    c.execute(PROFILES_TABLE.format(name="personal_profiles_new"))
+    rows = []
+    for user_id, data in c.execute("SELECT user_id, data FROM personal_profiles").fetchall():
+        try:
+            profile = json.loads(data or "{}")
+        except ValueError:
+            profile = {}
+        values = [profile.get(field) for field in PROFILE_FIELDS]
+        rows.append((user_id, *[", ".join(v) if isinstance(v, list) else v for v in values]))
+    c.executemany(f"""INSERT INTO personal_profiles_new (user_id, {", ".join(PROFILE_FIELDS)})
+                      VALUES (?, {", ".join("?" * len(PROFILE_FIELDS))})""", rows)
+    c.execute("DROP TABLE personal_profiles")
+    c.execute("ALTER TABLE personal_profiles_new RENAME TO personal_profiles")
+
+def _add_column(c, table: str, column: str, decl: str):
+    """Добавить колонку в существующую таблицу (миграция старых баз)"""
+    columns = {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
 def add_user(user_id: int, username: str = None, first_name: str = None, last_name: str = None):
     """Добавить пользователя в базу"""
     conn = sqlite3.connect(DB_PATH)
@@ -1,23 +1,20 @@
-import sqlite3
 from datetime import datetime, timedelta
 from aiogram import Router, types, Bot
 from aiogram.filters import Command, CommandObject
 from aiogram.types import ChatPermissions
-from core.security import check_admin_level
+from core.security import check_admin_level, permissions
 from services.moderator import Moderator
-from config import DB_PATH
+from services.settings import chat_settings
+from data.database import db
 
 router = Router()
 
-# === Глобальные настройки автомодерации ===
-AUTO_MOD_SETTINGS = {}  # chat_id: {"antimat": bool, "antiflood": bool}
-
 # === КОМАНДЫ АДМИНИСТРИРОВАНИЯ ===
 
 @router.message(Command("мут"))
 async def cmd_mute(message: types.Message, command: CommandObject):
     """Мут пользователя (требуется уровень 1+)"""
-    if not await check_admin_level(message.from_user.id, 1):
+    if not await check_admin_level(message.from_user.id, 1, message.chat.id):
         await message.reply("❌ Недостаточно прав (нужен уровень 1).")
         return
     
@@ -48,7 +45,7 @@ async def cmd_mute(message: types.Message, command: CommandObject):
 @router.message(Command("варн"))
 async def cmd_warn(message: types.Message, command: CommandObject):
     """Выдать предупреждение (требуется уровень 2+)"""
-    if not await check_admin_level(message.from_user.id, 2):
+    if not await check_admin_level(message.from_user.id, 2, message.chat.id):
         await message.reply("❌ Недостаточно прав (нужен уровень 2).")
         return
     
@@ -73,7 +70,7 @@ async def cmd_warn(message: types.Message, command: CommandObject):
 @router.message(Command("бан"))
 async def cmd_ban(message: types.Message, command: CommandObject):
     """Бан пользователя (требуется уровень 3+)"""
-    if not await check_admin_level(message.from_user.id, 3):
+    if not await check_admin_level(message.from_user.id, 3, message.chat.id):
         await message.reply("❌ Недостаточно прав (нужен уровень 3).")
         return
     
@@ -87,20 +84,16 @@ async def cmd_ban(message: types.Message, command: CommandObject):
     await message.bot.ban_chat_member(message.chat.id, target.id)
     
     # Логируем в БД
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""INSERT INTO moderations (chat_id, user_id, type, reason)
-                 VALUES (?, ?, 'ban', ?)""",
-              (message.chat.id, target.id, reason))
-    conn.commit()
-    conn.close()
+    await db.execute("""INSERT INTO moderations (chat_id, user_id, type, reason)
+                          VALUES (?, ?, 'ban', ?)""",
+                     (message.chat.id, target.id, reason))
     
     await message.reply(f"⛔ {target.full_name} забанен.\nПричина: {reason}")
 
 @router.message(Command("разбан"))
-async cmd_unban(message: types.Message):
+async def cmd_unban(message: types.Message):
     """Разбан пользователя (требуется уровень 3+)"""
-    if not await check_admin_level(message.from_user.id, 3):
+    if not await check_admin_level(message.from_user.id, 3, message.chat.id):
         await message.reply("❌ Недостаточно прав (нужен уровень 3).")
         return
     
@@ -118,7 +111,7 @@ async cmd_unban(message: types.Message):
 @router.message(Command("снять_варн"))
 async def cmd_unwarn(message: types.Message):
     """Снять предупреждение (требуется уровень 2+)"""
-    if not await check_admin_level(message.from_user.id, 2):
+    if not await check_admin_level(message.from_user.id, 2, message.chat.id):
         await message.reply("❌ Недостаточно прав (нужен уровень 2).")
         return
     
@@ -127,15 +120,12 @@ async def cmd_unwarn(message: types.Message):
         await message.reply("❌ Ответьте на сообщение пользователя.")
         return
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""DELETE FROM moderations 
-                 WHERE chat_id=? AND user_id=? AND type='warn'
-                 ORDER BY id DESC LIMIT 1""",
-              (message.chat.id, target.id))
-    deleted = c.rowcount
-    conn.commit()
-    conn.close()
+    cursor = await db.execute("""DELETE FROM moderations WHERE id = (
+                                     SELECT id FROM moderations 
+                                     WHERE chat_id=? AND user_id=? AND type='warn'
+                                     ORDER BY id DESC LIMIT 1)""",
+                              (message.chat.id, target.id))
+    deleted = cursor.rowcount
     
     if deleted:
         await message.reply(f"✅ Снято одно предупреждение у {target.full_name}.")
@@ -147,7 +137,7 @@ async def cmd_unwarn(message: types.Message):
 @router.message(Command("антимат"))
 async def cmd_antimat(message: types.Message):
     """Включить/выключить антимат (требуется уровень 2+)"""
-    if not await check_admin_level(message.from_user.id, 2):
+    if not await check_admin_level(message.from_user.id, 2, message.chat.id):
         await message.reply("❌ Недостаточно прав (нужен уровень 2).")
         return
     
@@ -156,18 +146,15 @@ async def cmd_antimat(message: types.Message):
         await message.reply("❌ Использование: /антимат вкл/выкл")
         return
     
-    chat_id = message.chat.id
-    if chat_id not in AUTO_MOD_SETTINGS:
-        AUTO_MOD_SETTINGS[chat_id] = {"antimat": False, "antiflood": False}
-    
-    AUTO_MOD_SETTINGS[chat_id]["antimat"] = (args[1].lower() == "вкл")
-    status = "включен" if AUTO_MOD_SETTINGS[chat_id]["antimat"] else "выключен"
+    enabled = (args[1].lower() == "вкл")
+    await chat_settings.set(message.chat.id, antimat=enabled)
+    status = "включен" if enabled else "выключен"
     await message.reply(f"✅ Антимат {status}.")
 
 @router.message(Command("антифлуд"))
 async def cmd_antiflood(message: types.Message):
     """Включить/выключить антифлуд (требуется уровень 2+)"""
-    if not await check_admin_level(message.from_user.id, 2):
+    if not await check_admin_level(message.from_user.id, 2, message.chat.id):
         await message.reply("❌ Недостаточно прав (нужен уровень 2).")
         return
     
@@ -176,18 +163,31 @@ async def cmd_antiflood(message: types.Message):
         await message.reply("❌ Использование: /антифлуд вкл/выкл")
         return
     
-    chat_id = message.chat.id
-    if chat_id not in AUTO_MOD_SETTINGS:
-        AUTO_MOD_SETTINGS[chat_id] = {"antimat": False, "antiflood": False}
-    
-    AUTO_MOD_SETTINGS[chat_id]["antiflood"] = (args[1].lower() == "вкл")
-    status = "включен" if AUTO_MOD_SETTINGS[chat_id]["antiflood"] else "выключен"
+    enabled = (args[1].lower() == "вкл")
+    await chat_settings.set(message.chat.id, antiflood=enabled)
+    status = "включен" if enabled else "выключен"
     await message.reply(f"✅ Антифлуд {status}.")
 
+@router.message(Command("хранение"))
+async def cmd_retention(message: types.Message):
+    """Сколько дней хранить историю сообщений чата (требуется уровень 3+)"""
+    if not await check_admin_level(message.from_user.id, 3, message.chat.id):
+        await message.reply("❌ Недостаточно прав (нужен уровень 3).")
+        return
+    
+    args = message.text.split()
+    if len(args) < 2 or not args[1].isdigit() or not 1 <= int(args[1]) <= 3650:
+        days = chat_settings.get(message.chat.id)["retention_days"]
+        await message.reply(f"❌ Использование: /хранение <дней от 1 до 3650>\nСейчас: {days} дн.")
+        return
+    
+    await chat_settings.set(message.chat.id, retention_days=int(args[1]))
+    await message.reply(f"✅ История хранится {args[1]} дн., более старая уходит в архив.")
+
 @router.message(Command("посадить_в_угол"))
 async def cmd_ignore_mode(message: types.Message, command: CommandObject):
     """Режим игнора (удаление сообщений N минут) (требуется уровень 1+)"""
-    if not await check_admin_level(message.from_user.id, 1):
+    if not await check_admin_level(message.from_user.id, 1, message.chat.id):
         await message.reply("❌ Недостаточно прав (нужен уровень 1).")
         return
     
@@ -205,14 +205,10 @@ async def cmd_ignore_mode(message: types.Message, command: CommandObject):
             pass
     
     # Сохраняем в БД
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
     expires = (datetime.now() + timedelta(minutes=duration)).isoformat()
-    c.execute("""INSERT INTO moderations (chat_id, user_id, type, expires, reason)
-                 VALUES (?, ?, 'ignore', ?, 'посажен в угол')""",
-              (message.chat.id, target.id, expires))
-    conn.commit()
-    conn.close()
+    await db.execute("""INSERT INTO moderations (chat_id, user_id, type, expires, reason)
+                          VALUES (?, ?, 'ignore', ?, 'посажен в угол')""",
+                     (message.chat.id, target.id, expires))
     
     await message.reply(
         f"🙊 {target.full_name} посажен в угол на {duration} минут.\n"
@@ -224,7 +220,8 @@ async def cmd_ignore_mode(message: types.Message, command: CommandObject):
 @router.message(Command("назначить"))
 async def cmd_promote(message: types.Message, command: CommandObject):
     """Назначить админа (только создатель чата)"""
-    if message.from_user.id != message.chat.creator.id:
+    member = await message.bot.get_chat_member(message.chat.id, message.from_user.id)
+    if member.status != "creator":
         await message.reply("❌ Только создатель чата может назначать админов.")
         return
     
@@ -241,13 +238,8 @@ async def cmd_promote(message: types.Message, command: CommandObject):
     level = int(args[0])
     level_names = {1: "стажер", 2: "новичок", 3: "почти босс"}
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""INSERT OR REPLACE INTO admins (user_id, chat_id, level)
-                 VALUES (?, ?, ?)""",
-              (target.id, message.chat.id, level))
-    conn.commit()
-    conn.close()
+    # Пишем в БД и сразу обновляем кэш прав
+    await permissions.set_level(message.chat.id, target.id, level, message.from_user.id)
     
     await message.reply(
         f"👑 {target.full_name} назначен на уровень {level} ({level_names[level]}).\n"
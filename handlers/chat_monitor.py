@@ -2,11 +2,18 @@ import asyncio
 import random
 from aiogram import Router, types, Bot
 from aiogram.filters import Command
-from services.ai_client import ask_groq
+from services.llm_scheduler import llm_scheduler, Priority
 from services.memory import memory
 from services.analytics import detect_conflict, log_message
 from services.moderator import Moderator
-from config import ACTIVITY_THRESHOLD
+from services.response_cache import response_cache
+from services.single_flight import single_flight
+from services.settings import chat_settings
+from services.users import user_directory
+from services.outbox import outbox, SendPriority
+from services.transcript import chat_transcript, user_transcript
+from services.chat_summaries import chat_summarizer
+from config import ACTIVITY_THRESHOLD, CHAT_SUMMARY_EVERY
 
 router = Router()
 
@@ -22,21 +29,26 @@ async def handle_all_messages(message: types.Message):
     msg_type = "sticker" if message.sticker else "gif" if message.animation else "text"
 
     # Логируем
-    log_message(chat_id, user_id, text[:500])
+    log_message(chat_id, user_id, text[:500], msg_type, message.chat.type, message.chat.title)
+    chat_summarizer.observe(chat_id)
 
     # Автомодерация
     moderator = Moderator(message.bot)
-    if await moderator.auto_moderate(chat_id, user_id, text, msg_type):
+    settings = chat_settings.get(chat_id)
+    if await moderator.auto_moderate(chat_id, user_id, text, msg_type,
+                                     message_id=message.message_id,
+                                     antimat=settings["antimat"], antiflood=settings["antiflood"]):
         return
 
     # Счётчик для прожарки
     message_counters[chat_id] = message_counters.get(chat_id, 0) + 1
     if message_counters[chat_id] >= ACTIVITY_THRESHOLD:
-        await roast_chat(message.bot, chat_id)
+        # Сбрасываем до ожидания: прожарка может долго ждать конспект и LLM
         message_counters[chat_id] = 0
+        await roast_chat(message.bot, chat_id)
 
     # Детектор конфликта
-    if detect_conflict(chat_id):
+    if detect_conflict(chat_id, text):
         await escalate_conflict(message)
         return
 
@@ -58,25 +70,41 @@ async def handle_all_messages(message: types.Message):
 # === Функции ===
 async def roast_chat(bot: Bot, chat_id: int):
     """Прожарка чата каждые 1000 сообщений"""
-    messages = memory.get_chat_messages(chat_id, limit=100)
-    if not messages:
+    # Период с прошлой прожарки: фоновые конспекты + свежий хвост дословно
+    await chat_summarizer.wait(chat_id)  # последний кусок периода может ещё сжиматься
+    since = chat_settings.get(chat_id)["last_roast_message"]
+    summaries = await chat_summarizer.since(chat_id, since)
+    covered = summaries[-1][0] if summaries else since
+    # Всё, что не вошло в конспекты (бюджет транскрипта оставит самые свежие)
+    messages = await memory.get_chat_messages(chat_id, limit=CHAT_SUMMARY_EVERY * 2, after_id=covered)
+    if not messages and not summaries:
         return
+    names = await user_directory.resolve({msg["user_id"] for msg in messages})
+    transcript = chat_transcript(messages, names) or "нет"
+    digest = "\n\n".join(summary for _, summary in summaries) or "нет"
     prompt = [{
         "role": "user",
-        "content": f"""Сгенерируй жёсткую, саркастичную прожарку чата на основе последних сообщений. 
+        "content": f"""Сгенерируй жёсткую, саркастичную прожарку чата за период с прошлой прожарки. 
         Используй чёрный юмор, подмечай глупости, передразнивай участников. 
-        Максимально конкретно и язвительно. Сообщения для анализа: {messages}"""
+        Максимально конкретно и язвительно.
+Конспект переписки за период:
+{digest}
+Последние сообщения:
+{transcript}"""
     }]
     try:
-        roast = await ask_groq(prompt, temperature=0.9)
-        await bot.send_message(chat_id, f"🔥 ПРОЖАРКА ЧАТА (1000 сообщений):\n\n{roast}")
+        roast = await llm_scheduler.ask(prompt, temperature=0.9, priority=Priority.PROVOCATION)
+        await outbox.send_message(bot, chat_id, f"🔥 ПРОЖАРКА ЧАТА (1000 сообщений):\n\n{roast}")
+        last_id = messages[-1]["id"] if messages else covered
+        await chat_settings.set(chat_id, last_roast_message=last_id)
+        await chat_summarizer.prune(chat_id, last_id)
     except Exception as e:
         print(f"Ошибка прожарки: {e}")
 
 async def escalate_conflict(message: types.Message):
     """Вмешательство в конфликт с агрессией"""
     chat_id = message.chat.id
-    context = memory.get_context(chat_id, limit=15)
+    context = await memory.get_context(chat_id, limit=15)
     prompt = [{
         "role": "user",
         "content": f"""Ты — язвительный участник конфликта. Твоя цель — максимально жёстко унизить всех спорщиков, 
@@ -84,29 +112,35 @@ async def escalate_conflict(message: types.Message):
         Ответь коротко (3-4 предложения), но метко. Контекст: {context}"""
     }]
     try:
-        reply = await ask_groq(prompt, temperature=0.95)
-        await message.reply(reply[:500])
+        reply = await llm_scheduler.ask(prompt, temperature=0.95, priority=Priority.PROVOCATION)
+        await outbox.reply(message, reply[:500], SendPriority.REPLY)
     except Exception as e:
         print(f"Ошибка эскалации: {e}")
 
 async def answer_question(message: types.Message):
     """Ответ на вопрос в чате"""
+    question = message.text or message.caption or ""
     prompt = [{
         "role": "user",
         "content": f"""Дай максимально точный и краткий ответ на вопрос. 
         Добавь лёгкую язвительность, если вопрос простой. 
-        Вопрос: {message.text}"""
+        Вопрос: {question}"""
     }]
     try:
-        answer = await ask_groq(prompt, temperature=0.7)
-        await message.reply(answer[:300])
+        # Частые вопросы отвечаем из кэша без запроса к модели
+        key = response_cache.make_key(question, "answer_question", 0.7)
+        answer = await response_cache.get(key)
+        if answer is None:
+            answer = await llm_scheduler.ask(prompt, temperature=0.7, priority=Priority.QUESTION)
+            await response_cache.set(key, answer)
+        await outbox.reply(message, answer[:300], SendPriority.REPLY)
     except Exception:
         pass
 
 async def reply_to_mention(message: types.Message):
     """Ответ при упоминании бота"""
     chat_id = message.chat.id
-    context = memory.get_context(chat_id, limit=10)
+    context = await memory.get_context(chat_id, limit=10)
     prompt = [{
         "role": "user",
         "content": f"""Ответь на сообщение в том же стиле, но с сарказмом. 
@@ -114,8 +148,8 @@ async def reply_to_mention(message: types.Message):
         Контекст: {context}\nСообщение: {message.text}"""
     }]
     try:
-        reply = await ask_groq(prompt, temperature=0.85)
-        await message.reply(reply[:400])
+        reply = await llm_scheduler.ask(prompt, temperature=0.85, priority=Priority.MENTION)
+        await outbox.reply(message, reply[:400], SendPriority.REPLY)
     except Exception as e:
         print(f"Ошибка ответа: {e}")
 
@@ -126,18 +160,19 @@ async def is_chat_quiet(chat_id: int) -> bool:
 
 async def provoke_chat(bot: Bot, chat_id: int):
     """Провокация при тишине"""
-    users = memory.get_chat_messages(chat_id, limit=5)
+    users = await memory.get_chat_messages(chat_id, limit=5)
     if not users:
         return
-    target = users[-1]["user_id"]  # Последний писавший
+    target_id = users[-1]["user_id"]  # Последний писавший
+    target = (await user_directory.resolve([target_id])).get(target_id) or target_id
     prompt = [{
         "role": "user",
         "content": f"""Придумай провокационное сообщение, чтобы разжечь дискуссию в чате. 
         Нацелься на пользователя {target}. Будь язвительным, но умным."""
     }]
     try:
-        provocation = await ask_groq(prompt, temperature=0.9)
-        await bot.send_message(chat_id, provocation[:350])
+        provocation = await llm_scheduler.ask(prompt, temperature=0.9, priority=Priority.PROVOCATION)
+        await outbox.send_message(bot, chat_id, provocation[:350])
     except Exception as e:
         print(f"Ошибка провокации: {e}")
 
@@ -147,21 +182,30 @@ async def personal_roast(message: types.Message):
     """Прожарка конкретного пользователя"""
     target = message.reply_to_message.from_user if message.reply_to_message else message.from_user
     chat_id = message.chat.id
-    user_messages = memory.get_user_messages(target.id, chat_id, limit=30)
-    if not user_messages:
-        await message.reply("Недостаточно данных для прожарки.")
-        return
-    prompt = [{
-        "role": "user",
-        "content": f"""Унизи пользователя {target.full_name} на основе его сообщений. 
-        Будь максимально жёстким, используй конкретные цитаты, высмеивай противоречия. 
-        Сообщения пользователя: {user_messages}"""
-    }]
-    try:
-        roast = await ask_groq(prompt, temperature=0.95)
-        await message.reply(f"🔥 Прожарка для {target.mention}:\n\n{roast}")
+
+    async def generate():
+        user_messages = await memory.get_user_messages(target.id, chat_id, limit=30)
+        if not user_messages:
+            return None
+        prompt = [{
+            "role": "user",
+            "content": f"""Унизи пользователя {target.full_name} на основе его сообщений. 
+            Будь максимально жёстким, используй конкретные цитаты, высмеивай противоречия. 
+            Сообщения пользователя:
+{user_transcript(user_messages)}"""
+        }]
+        roast = await llm_scheduler.ask(prompt, temperature=0.95, priority=Priority.COMMAND)
         # Кэшируем
-        memory.cache_roast(target.id, chat_id, roast)
+        await memory.cache_roast(target.id, chat_id, roast)
+        return roast
+
+    try:
+        # Одновременные /прожарь на одну цель ждут одну генерацию
+        roast = await single_flight.do(("roast", target.id, chat_id), generate)
+        if roast is None:
+            await outbox.reply(message, "Недостаточно данных для прожарки.", SendPriority.REPLY)
+            return
+        await outbox.reply(message, f"🔥 Прожарка для {target.mention}:\n\n{roast}", SendPriority.REPLY)
     except Exception as e:
-        await message.reply("Не удалось прожарить, попробуй позже.")
+        await outbox.reply(message, "Не удалось прожарить, попробуй позже.", SendPriority.REPLY)
         print(f"Ошибка персональной прожарки: {e}")
\ No newline at end of file
@@ -1,13 +1,16 @@
 import json
+import time
 from datetime import datetime
 from aiogram import Router, types, F
-from aiogram.filters import Command, StateFilter
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.base import StorageKey
-from services.ai_client import ask_groq
+from aiogram.exceptions import TelegramBadRequest
+from services.llm_scheduler import llm_scheduler, Priority
 from services.memory import memory
-from config import CREATOR_ID
+from services.profiles import profile_store
+from config import CREATOR_ID, STREAM_EDIT_INTERVAL
 
 router = Router()
 
@@ -112,7 +115,7 @@ async def process_timezone(message: types.Message, state: FSMContext):
     data = await state.get_data()
     
     # Сохраняем профиль
-    memory.save_profile(message.from_user.id, data)
+    await memory.save_profile(message.from_user.id, data)
     
     # Формируем сводку
     summary = "✅ Профиль сохранён!\n\nСводка:\n"
@@ -127,6 +130,51 @@ async def process_timezone(message: types.Message, state: FSMContext):
     await message.answer(summary)
     await state.clear()
 
+# === ПОТОКОВЫЙ ВЫВОД ОТВЕТА ===
+class StreamRenderer:
+    """Показывает ответ по мере генерации: первое сообщение — с первым куском,
+    дальше правки не чаще STREAM_EDIT_INTERVAL секунд"""
+
+    def __init__(self, message: types.Message, limit: int = 4000):
+        self.message = message
+        self.limit = limit
+        self.text = ""
+        self._sent = None
+        self._shown = ""
+        self._last_edit = 0.0
+
+    async def feed(self, chunk: str):
+        self.text += chunk
+        if self._sent is None:
+            if self.text.strip():
+                # Без parse_mode: незакрытый тег в середине потока сломал бы HTML
+                self._sent = await self.message.answer(self.text[:self.limit], parse_mode=None)
+                self._shown = self.text[:self.limit]
+                self._last_edit = time.monotonic()
+            return
+        if time.monotonic() - self._last_edit >= STREAM_EDIT_INTERVAL:
+            await self._edit()
+
+    async def finish(self) -> str:
+        """Показать финальный текст и вернуть его целиком"""
+        if self._sent is None:
+            if self.text.strip():
+                await self.message.answer(self.text[:self.limit], parse_mode=None)
+        else:
+            await self._edit()
+        return self.text
+
+    async def _edit(self):
+        visible = self.text[:self.limit]
+        self._last_edit = time.monotonic()
+        if visible == self._shown:
+            return
+        try:
+            await self._sent.edit_text(visible, parse_mode=None)
+            self._shown = visible
+        except TelegramBadRequest:
+            pass  # "message is not modified" и т.п. — дождёмся следующей правки
+
 # === ОБРАБОТКА ЛЮБЫХ СООБЩЕНИЙ В ЛС (ассистент) ===
 @router.message(F.chat.type == "private")
 async def handle_personal_assistant(message: types.Message, state: FSMContext):
@@ -134,8 +182,8 @@ async def handle_personal_assistant(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     text = message.text or message.caption or ""
     
-    # Загружаем профиль
-    profile = memory.load_profile(user_id)
+    # Загружаем профиль (из кэша, вместе с готовым фрагментом промпта)
+    profile = await profile_store.get(user_id)
     
     # Если профиля нет — предлагаем создать
     if not profile:
@@ -143,37 +191,30 @@ async def handle_personal_assistant(message: types.Message, state: FSMContext):
             "⚠️ Профиль не настроен. Для персонализации выполните /profile\n"
             "Но я всё равно отвечу в общем режиме."
         )
-        profile = {}
     
     # Формируем системный промпт с учётом профиля
     system_prompt = {
         "role": "system",
         "content": f"""Ты персональный ассистент. Учитывай профиль пользователя:
-        - Язык: {profile.get('language', 'русский')}
-        - Интересы: {profile.get('interests', 'не указаны')}
-        - Стиль ответов: {profile.get('style', 'нейтральный')}
-        - Запретные темы: {profile.get('banned_topics', 'нет')}
+        {await profile_store.prompt(user_id)}
         
         Отвечай на языке пользователя. Будь полезным, но добавляй лёгкую иронию если стиль 'саркастичный'.
         Избегай запретных тем. Отвечай кратко, по делу."""
     }
     
-    # Загружаем историю диалога
-    chat_context = memory.get_context(user_id, limit=15)  # user_id как chat_id для ЛС
-    
-    # Формируем сообщения для ИИ
-    messages = [system_prompt] + chat_context + [{"role": "user", "content": text}]
+    # Формируем сообщения для ИИ: резюме + свежие реплики в рамках бюджета токенов
+    messages = await memory.build_context(user_id, system_prompt, text)  # user_id как chat_id для ЛС
     
     try:
-        # Отправляем запрос
-        response = await ask_groq(messages, temperature=0.7)
+        # Отправляем запрос и показываем ответ по мере генерации
+        renderer = StreamRenderer(message)
+        async for chunk in llm_scheduler.stream(messages, temperature=0.7, priority=Priority.ASSISTANT):
+            await renderer.feed(chunk)
+        response = await renderer.finish()
         
         # Сохраняем в историю
-        memory.add_context(user_id, "user", text)
-        memory.add_context(user_id, "assistant", response)
-        
-        # Отправляем ответ
-        await message.answer(response[:4000])
+        await memory.add_context(user_id, "user", text)
+        await memory.add_context(user_id, "assistant", response)
         
     except Exception as e:
         await message.answer(f"⚠️ Ошибка: {str(e)}")
@@ -187,7 +228,7 @@ async def cmd_show_profile(message: types.Message):
         await message.answer("Эта команда работает только в личных сообщениях.")
         return
     
-    profile = memory.load_profile(message.from_user.id)
+    profile = await memory.load_profile(message.from_user.id)
     if not profile:
         await message.answer("Профиль не настроен. Используйте /profile")
         return
@@ -207,7 +248,7 @@ async def cmd_clear_history(message: types.Message):
     if message.chat.type != "private":
         return
     
-    memory.clear_context(message.from_user.id)
+    await memory.clear_context(message.from_user.id)
     await message.answer("🗑 История диалога очищена.")
 
 # === СПЕЦИАЛЬНАЯ КОМАНДА ДЛЯ СОЗДАТЕЛЯ ===
@@ -223,7 +264,7 @@ async def cmd_inspect_profile(message: types.Message, command: CommandObject):
         return
     
     user_id = int(args)
-    profile = memory.load_profile(user_id)
+    profile = await memory.load_profile(user_id)
     
     if not profile:
         await message.answer(f"Профиль для ID {user_id} не найден.")
@@ -1,9 +1,16 @@
 from aiogram import Router, types
 from aiogram.filters import Command, CommandObject
 from aiogram.utils.markdown import hlink
-from services.analytics import get_chat_stats
+from services.analytics import get_chat_stats, get_user_rank
 from services.memory import memory
-from services.ai_client import ask_groq
+from services.llm_scheduler import llm_scheduler, Priority
+from services.single_flight import single_flight
+from services.users import user_directory
+from services.chats import count_chats
+from services.transcript import user_transcript
+from services.outbox import outbox
+from data.database import db
+from utils.metrics import metrics
 from config import CREATOR_ID
 
 router = Router()
@@ -30,34 +37,30 @@ async def cmd_activity(message: types.Message, command: CommandObject):
     
     if target == 'user':
         # Активность конкретного пользователя
-        user_id = message.reply_to_message.from_user.id if message.reply_to_message else message.from_user.id
-        stats = get_chat_stats(chat_id, period)
-        user_rank = next((i+1 for i, (uid, _) in enumerate(stats) if uid == user_id), None)
+        user = message.reply_to_message.from_user if message.reply_to_message else message.from_user
+        user_rank, total_msgs = await get_user_rank(chat_id, user.id, period)
         if user_rank:
-            total_msgs = next(count for uid, count in stats if uid == user_id)
-            await message.reply(
-                f"📊 {message.from_user.full_name}:\n"
+            await outbox.reply(
+                message,
+                f"📊 {user.full_name}:\n"
                 f"• Место в топе: #{user_rank}\n"
                 f"• Сообщений за период: {total_msgs}\n"
                 f"• Период: {period}"
             )
         else:
-            await message.reply("Активность не найдена.")
+            await outbox.reply(message, "Активность не найдена.")
     else:
         # Топ чата
-        stats = get_chat_stats(chat_id, period)[:10]
+        stats = await get_chat_stats(chat_id, period)
         if not stats:
-            await message.reply("Нет данных об активности.")
+            await outbox.reply(message, "Нет данных об активности.")
             return
         text = f"🏆 Топ активности ({period}):\n"
+        names = await user_directory.resolve([user_id for user_id, _ in stats])
         for i, (user_id, count) in enumerate(stats, 1):
-            try:
-                user = await message.bot.get_chat(user_id)
-                name = user.full_name
-            except:
-                name = f"ID{user_id}"
+            name = names.get(user_id) or f"ID{user_id}"
             text += f"{i}. {name}: {count} сообщ.\n"
-        await message.reply(text)
+        await outbox.reply(message, text)
 
 # === Команда ТЫ КТО ===
 @router.message(Command("ты_кто"))
@@ -67,30 +70,38 @@ async def cmd_who(message: types.Message):
     chat_id = message.chat.id
     
     # Проверяем кэш
-    cached = memory.get_cached_roast(target.id, chat_id)
+    cached = await memory.get_cached_roast(target.id, chat_id)
     if cached:
-        await message.reply(f"🎯 {target.full_name}, я тебя помню:\n\n{cached}")
+        await outbox.reply(message, f"🎯 {target.full_name}, я тебя помню:\n\n{cached}")
         return
     
-    # Берём последние сообщения цели
-    user_messages = memory.get_user_messages(target.id, chat_id, limit=20)
-    if not user_messages:
-        await message.reply("Мало данных для характеристики.")
-        return
+    async def generate():
+        # Берём последние сообщения цели
+        user_messages = await memory.get_user_messages(target.id, chat_id, limit=20)
+        if not user_messages:
+            return None
+        
+        # Генерируем через ИИ
+        prompt = [{
+            "role": "user",
+            "content": f"""Создай краткую (2-3 предложения) язвительную характеристику пользователя на основе его сообщений. 
+            Используй конкретные факты, высмеивай глупости, будь максимально едким. 
+            Сообщения пользователя:
+{user_transcript(user_messages)}"""
+        }]
+        roast = await llm_scheduler.ask(prompt, temperature=0.9, priority=Priority.COMMAND)
+        await memory.cache_roast(target.id, chat_id, roast)
+        return roast
     
-    # Генерируем через ИИ
-    prompt = [{
-        "role": "user",
-        "content": f"""Создай краткую (2-3 предложения) язвительную характеристику пользователя на основе его сообщений. 
-        Используй конкретные факты, высмеивай глупости, будь максимально едким. 
-        Сообщения пользователя: {user_messages}"""
-    }]
     try:
-        roast = await ask_groq(prompt, temperature=0.9)
-        await message.reply(f"🔍 {target.full_name}, вот кто ты:\n\n{roast}")
-        memory.cache_roast(target.id, chat_id, roast)
+        # Одновременные /ты_кто на одну цель ждут одну генерацию
+        roast = await single_flight.do(("who", target.id, chat_id), generate)
+        if roast is None:
+            await outbox.reply(message, "Мало данных для характеристики.")
+            return
+        await outbox.reply(message, f"🔍 {target.full_name}, вот кто ты:\n\n{roast}")
     except Exception as e:
-        await message.reply("Не удалось охарактеризовать.")
+        await outbox.reply(message, "Не удалось охарактеризовать.")
         print(f"Ошибка характеристики: {e}")
 
 # === Команда СТАТУС ===
@@ -101,24 +112,24 @@ async def cmd_status(message: types.Message):
     chat_id = message.chat.id
     
     # Базовая инфа
-    profile = memory.load_profile(user.id)
+    profile = await memory.load_profile(user.id)
     warns = 0  # Здесь нужно получить количество варнов из moderations
     
     # Активность
-    stats = get_chat_stats(chat_id, 'all')
-    user_stats = next((count for uid, count in stats if uid == user.id), 0)
-    rank = next((i+1 for i, (uid, _) in enumerate(stats) if uid == user.id), '?')
+    rank, user_stats = await get_user_rank(chat_id, user.id, 'all')
+    rank = rank or '?'
     
     # Генерация персональной цитаты
-    user_messages = memory.get_user_messages(user.id, chat_id, limit=15)
+    user_messages = await memory.get_user_messages(user.id, chat_id, limit=15)
     quote = "Нет данных"
     if user_messages:
         prompt = [{
             "role": "user",
-            "content": f"Придумай одну ёмкую, язвительную цитату-подпись для пользователя на основе его сообщений: {user_messages}"
+            "content": f"Придумай одну ёмкую, язвительную цитату-подпись для пользователя на основе его сообщений:\n"
+                       f"{user_transcript(user_messages)}"
         }]
         try:
-            quote = await ask_groq(prompt, temperature=0.8)
+            quote = await llm_scheduler.ask(prompt, temperature=0.8, priority=Priority.COMMAND)
         except:
             quote = "Ошибка генерации"
     
@@ -135,7 +146,7 @@ async def cmd_status(message: types.Message):
         text += f"• Язык: {profile.get('language', 'не указан')}\n"
         text += f"• Страна: {profile.get('country', 'не указана')}"
     
-    await message.reply(text)
+    await outbox.reply(message, text)
 
 # === Команда для создателя: полная статистика ===
 @router.message(Command("full_stats"))
@@ -144,22 +155,11 @@ async def cmd_full_stats(message: types.Message):
     if message.from_user.id != CREATOR_ID:
         return
     
-    import sqlite3
-    from config import DB_PATH
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute("SELECT COUNT(*) FROM users")
-    total_users = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(DISTINCT chat_id) FROM chat_history")
-    total_chats = c.fetchone()[0]
-    
-    c.execute("SELECT SUM(messages) FROM activity")
-    total_messages = c.fetchone()[0] or 0
-    
-    c.execute("SELECT COUNT(*) FROM moderations WHERE type='warn'")
-    total_warns = c.fetchone()[0]
+    total_users = await db.fetchval("SELECT COUNT(*) FROM users", default=0)
+    total_chats = await count_chats()
+    total_messages = await db.fetchval("SELECT SUM(messages) FROM activity", default=0)
+    total_warns = await db.fetchval("SELECT COUNT(*) FROM moderations WHERE type='warn'", default=0)
+    total_roasts = await db.fetchval("SELECT COUNT(*) FROM roast_cache", default=0)
     
     text = (
         f"📈 ГЛОБАЛЬНАЯ СТАТИСТИКА:\n"
@@ -167,10 +167,17 @@ async def cmd_full_stats(message: types.Message):
         f"• Чатов: {total_chats}\n"
         f"• Сообщений всего: {total_messages}\n"
         f"• Выдано предупреждений: {total_warns}\n"
-        f"• Прожарок закэшировано: {memory.conn.execute('SELECT COUNT(*) FROM roast_cache').fetchone()[0]}"
+        f"• Прожарок закэшировано: {total_roasts}"
     )
-    conn.close()
-    await message.reply(text)
+    await outbox.reply(message, text)
+
+# === Команда для создателя: метрики ===
+@router.message(Command("metrics"))
+async def cmd_metrics(message: types.Message):
+    """Внутренние метрики бота (только создатель)"""
+    if message.from_user.id != CREATOR_ID:
+        return
+    await outbox.reply(message, f"📟 Метрики:\n{metrics.render()}"[:4000])
 
 # === Команда помощи ===
 @router.message(Command("help", "помощь"))
@@ -190,12 +197,14 @@ async def cmd_help(message: types.Message):
 • /варн [причина] — предупреждение
 • /разбан — разбан
 • /антимат вкл/выкл — авто-модерация
+• /хранение [дней] — срок хранения истории чата
 
 📢 Для создателя:
 • /add_ad — добавить рекламу
 • /ad_stats — статистика по рекламе
 • /full_stats — полная статистика
+• /metrics — внутренние метрики
 
 Бот также отвечает на вопросы, вступает в конфликты и прожаривает чат каждые 1000 сообщений.
     """
-    await message.reply(help_text)
\ No newline at end of file
+    await outbox.reply(message, help_text)
\ No newline at end of file
@@ -10,8 +10,10 @@ sys.path.append(str(Path(__file__).parent))
 from core.bot import bot, dp, setup_dispatcher
 from utils.logger import logger
 from data.models import init_database, add_user
-from services.memory import memory
+from data.database import db
 from handlers.advertising import ad_scheduler
+from services.ingestion import ingestor
+from services.retention import history_retention
 
 async def main():
     """Основная функция запуска"""
@@ -23,6 +25,7 @@ async def main():
     
     # Запуск фоновых задач
     asyncio.create_task(ad_scheduler(bot))
+    ingestor.start()
     
     # Запуск бота
     logger.info("Запускаем поллинг...")
@@ -31,7 +34,10 @@ async def main():
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
     finally:
-        memory.close()
+        await history_retention.stop()
+        # Сбрасываем очередь сообщений до закрытия пула
+        await ingestor.stop()
+        await db.close()
         logger.info("Бот остановлен")
 
 if __name__ == "__main__":
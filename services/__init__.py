@@ -1,11 +1,14 @@
 # Импортируем ключевые сервисы
 from .ai_client import ask_groq
+from .llm_scheduler import llm_scheduler, Priority
 from .memory import memory
 from .analytics import *
 from .moderator import Moderator
 
 __all__ = [
     'ask_groq',
+    'llm_scheduler',
+    'Priority',
     'memory',
     'Moderator'
 ]
\ No newline at end of file
@@ -1,17 +1,132 @@
+import json
+import time
 import aiohttp
-from config import GROQ_API_KEY, GROQ_API_URL, MODEL_NAME
+from config import (GROQ_API_KEY, GROQ_API_URL, MODEL_NAME, GROQ_MAX_CONNECTIONS,
+                    GROQ_CONNECT_TIMEOUT, GROQ_READ_TIMEOUT)
+from utils.logger import logger
+from utils.metrics import metrics
 
-async def ask_groq(messages: list, temperature: float = 0.85) -> str:
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": MODEL_NAME,
-        "messages": messages,
-        "temperature": temperature
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(GROQ_API_URL, json=data, headers=headers) as resp:
+
+class GroqClient:
+    """Долгоживущий HTTP-клиент Groq с пулом keep-alive соединений"""
+
+    def __init__(self, api_url: str = GROQ_API_URL, api_key: str = GROQ_API_KEY, model: str = MODEL_NAME):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self._session = None
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_create(session, ctx, params):
+            metrics.inc("groq.connections_created")
+
+        async def on_reuse(session, ctx, params):
+            metrics.inc("groq.connections_reused")
+
+        async def on_dns_hit(session, ctx, params):
+            metrics.inc("groq.dns_cache_hits")
+
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        trace.on_dns_cache_hit.append(on_dns_hit)
+        return trace
+
+    async def start(self):
+        """Открыть сессию (вызывается в on_startup)"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=GROQ_MAX_CONNECTIONS,
+            limit_per_host=GROQ_MAX_CONNECTIONS,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+            enable_cleanup_closed=True,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=GROQ_CONNECT_TIMEOUT + GROQ_READ_TIMEOUT,
+            connect=GROQ_CONNECT_TIMEOUT,
+            sock_read=GROQ_READ_TIMEOUT,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            trace_configs=[self._trace_config()],
+        )
+
+    async def close(self):
+        """Закрыть сессию (вызывается в on_shutdown)"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            logger.info(f"Groq: {self.stats()}")
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def ask(self, messages: list, temperature: float = 0.85) -> str:
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature
+        }
+        session = await self._get_session()
+        started = time.perf_counter()
+        async with session.post(self.api_url, json=data) as resp:
+            resp.raise_for_status()
             result = await resp.json()
-            return result['choices'][0]['message']['content']
\ No newline at end of file
+        metrics.inc("groq.requests")
+        metrics.observe("groq.latency_ms", (time.perf_counter() - started) * 1000)
+        return result['choices'][0]['message']['content']
+
+    async def stream(self, messages: list, temperature: float = 0.85):
+        """Потоковый ответ: отдаёт куски текста по мере прихода SSE-событий"""
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True
+        }
+        session = await self._get_session()
+        started = time.perf_counter()
+        first_chunk = True
+        async with session.post(self.api_url, json=data) as resp:
+            resp.raise_for_status()
+            async for raw in resp.content:  # StreamReader отдаёт построчно
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                delta = json.loads(payload)["choices"][0].get("delta", {}).get("content")
+                if not delta:
+                    continue
+                if first_chunk:
+                    first_chunk = False
+                    metrics.observe("groq.first_token_ms", (time.perf_counter() - started) * 1000)
+                yield delta
+        metrics.inc("groq.requests")
+        metrics.observe("groq.latency_ms", (time.perf_counter() - started) * 1000)
+
+    def stats(self) -> str:
+        """Статистика переиспользования соединений"""
+        created = metrics.counters["groq.connections_created"]
+        reused = metrics.counters["groq.connections_reused"]
+        total = created + reused
+        ratio = reused / total * 100 if total else 0
+        return f"запросов {metrics.counters['groq.requests']}, соединений открыто {created}, переиспользовано {reused} ({ratio:.0f}%)"
+
+
+# Глобальный экземпляр
+groq_client = GroqClient()
+
+async def ask_groq(messages: list, temperature: float = 0.85) -> str:
+    return await groq_client.ask(messages, temperature)
@@ -1,49 +1,69 @@
-import sqlite3
-from datetime import datetime, timedelta
-from config import DB_PATH
-
-def log_message(chat_id: int, user_id: int, text: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO chat_history (chat_id, user_id, text) VALUES (?, ?, ?)",
-              (chat_id, user_id, text))
-    # Активность
-    c.execute('''INSERT OR REPLACE INTO activity (user_id, chat_id, date, messages)
-                 VALUES (?, ?, DATE('now'), COALESCE((SELECT messages+1 FROM activity 
-                 WHERE user_id=? AND chat_id=? AND date=DATE('now')), 1))''',
-              (user_id, chat_id, user_id, chat_id))
-    conn.commit()
-    conn.close()
-
-def get_chat_stats(chat_id: int, period: str = 'all'):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    query = "SELECT user_id, SUM(messages) as total FROM activity WHERE chat_id=?"
-    if period == 'day':
-        query += " AND date = DATE('now')"
-    elif period == 'week':
-        query += " AND date >= DATE('now', '-7 days')"
-    elif period == 'month':
-        query += " AND date >= DATE('now', '-30 days')"
-    query += " GROUP BY user_id ORDER BY total DESC LIMIT 10"
-    c.execute(query, (chat_id,))
-    rows = c.fetchall()
-    conn.close()
-    return rows
-
-def detect_conflict(chat_id: int, recent_messages=20):
+import re
+import time
+from collections import deque
+from services.ingestion import ingestor
+from services.leaderboard import leaderboards
+from config import CONFLICT_COOLDOWN
+
+# Простая эвристика: оскорбления и грубые реплики
+CONFLICT_KEYWORDS = ['дурак', 'идиот', 'заткнись', 'ты неправ', 'чушь']
+_CONFLICT_PATTERN = re.compile("|".join(map(re.escape, CONFLICT_KEYWORDS)), re.IGNORECASE)
+
+def log_message(chat_id: int, user_id: int, text: str, message_type: str = 'text',
+                chat_type: str = None, title: str = None):
+    """Записать сообщение и активность (пакетно, через очередь)"""
+    ingestor.log_message(chat_id, user_id, text, message_type, chat_type, title)
+    leaderboards.record(chat_id, user_id)
+
+async def get_chat_stats(chat_id: int, period: str = 'all', limit: int = 10):
+    """Топ чата за текущие сутки/неделю/месяц или всё время"""
+    return await leaderboards.top(chat_id, period, limit)
+
+async def get_user_rank(chat_id: int, user_id: int, period: str = 'all'):
+    """(место, сообщений) пользователя в чате; место None, если сообщений нет"""
+    return await leaderboards.rank(chat_id, period, user_id)
+
+class ConflictDetector:
+    """Скользящее окно флагов «негатива» по каждому чату.
+
+    Каждое сообщение обновляет окно за O(1); после срабатывания чат
+    молчит CONFLICT_COOLDOWN секунд, чтобы не отвечать на каждую реплику ссоры.
+    """
+
+    def __init__(self, window: int = 20, min_messages: int = 5, threshold: int = 3,
+                 cooldown: float = CONFLICT_COOLDOWN):
+        self.window = window
+        self.min_messages = min_messages
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._windows = {}     # chat_id: deque флагов
+        self._negative = {}    # chat_id: число True в окне
+        self._last_fired = {}  # chat_id: время последнего срабатывания
+
+    def feed(self, chat_id: int, text: str) -> bool:
+        """Учесть сообщение; True — конфликт и пора вмешаться"""
+        flags = self._windows.get(chat_id)
+        if flags is None:
+            flags = self._windows[chat_id] = deque(maxlen=self.window)
+        negative = bool(text) and _CONFLICT_PATTERN.search(text) is not None
+        count = self._negative.get(chat_id, 0)
+        if len(flags) == self.window:
+            count -= flags[0]
+        flags.append(negative)
+        count += negative
+        self._negative[chat_id] = count
+
+        if len(flags) < self.min_messages or count < self.threshold:
+            return False
+        now = time.monotonic()
+        if now - self._last_fired.get(chat_id, float("-inf")) < self.cooldown:
+            return False
+        self._last_fired[chat_id] = now
+        return True
+
+
+conflict_detector = ConflictDetector()
+
+def detect_conflict(chat_id: int, text: str) -> bool:
     """Анализ последних сообщений на предмет конфликта"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''SELECT text FROM chat_history 
-                 WHERE chat_id=? ORDER BY id DESC LIMIT ?''',
-              (chat_id, recent_messages))
-    messages = [row[0] for row in c.fetchall()]
-    conn.close()
-
-    # Простая эвристика: повторяющиеся ответы, оскорбления, много восклицательных знаков
-    conflict_keywords = ['дурак', 'идиот', 'заткнись', 'ты неправ', 'чушь']
-    if len(messages) < 5:
-        return False
-    negative_count = sum(1 for msg in messages if any(kw in msg.lower() for kw in conflict_keywords))
-    return negative_count >= 3  # Конфликт детектирован
\ No newline at end of file
+    return conflict_detector.feed(chat_id, text)
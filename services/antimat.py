@@ -0,0 +1,157 @@
+from pathlib import Path
+from config import ANTIMAT_WORDS_PATH
+
+# Латинские, цифровые и прочие двойники кириллических букв
+LOOKALIKES = {
+    "a": "а", "b": "б", "c": "с", "e": "е", "k": "к", "m": "м", "h": "н",
+    "o": "о", "p": "р", "t": "т", "x": "х", "y": "у", "u": "и", "i": "и",
+    "3": "з", "0": "о", "4": "ч", "6": "б", "@": "а", "$": "с", "ё": "е",
+}
+_TABLE = str.maketrans(LOOKALIKES)
+
+# Основы слов. По умолчанию основа ищется с начала слова,
+# «*» в начале — в любом месте слова.
+DEFAULT_WORDS = [
+    "бля", "хуй", "хуе", "хуя", "хуи", "нахуй", "похуй", "охуе", "нихуя",
+    "*пизд", "ебат", "ебан", "ебал", "ебу", "ебл", "ебн", "заеб", "выеб",
+    "уеб", "отъеб", "съеб", "доеб", "проеб", "поеб", "наеб", "разъеб",
+    "мудак", "мудил", "пидор", "пидар", "пидр", "залуп", "гандон", "шлюх",
+    "сука", "суки", "сучк", "сучар", "дроч",
+]
+
+
+def load_words(path: str = ANTIMAT_WORDS_PATH) -> list:
+    """Словарь из файла (по слову в строке) или встроенный"""
+    file = Path(path)
+    if not file.exists():
+        return DEFAULT_WORDS
+    words = [line.strip() for line in file.read_text(encoding="utf-8").splitlines()]
+    return [w for w in words if w and not w.startswith("#")]
+
+
+def normalize(text: str) -> str:
+    """Та же нормализация, что при проверке: двойники, разделители, повторы"""
+    result = []
+    for ch in text.lower().translate(_TABLE):
+        if ch.isalpha() and (not result or result[-1] != ch):
+            result.append(ch)
+    return "".join(result)
+
+
+class ProfanityFilter:
+    """Автомат Ахо — Корасик над нормализованным текстом.
+
+    Строится один раз из словаря; проверка сообщения — один проход по тексту,
+    в котором же делается нормализация (двойники, разделители, повторы букв).
+    """
+
+    def __init__(self, words: list):
+        self._goto = [{}]      # переходы узла
+        self._fail = [0]       # суффиксные ссылки
+        self._out = [()]       # (длина, только с начала слова, слово)
+        for word in words:
+            anywhere = word.startswith("*")
+            stem = normalize(word.lstrip("*"))
+            if stem:
+                self._add(stem, not anywhere, word)
+        self._build()
+
+    def _add(self, stem: str, anchored: bool, word: str):
+        node = 0
+        for ch in stem:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] += ((len(stem), anchored, word),)
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        for node in queue:  # обход в ширину; список растёт по ходу
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] += self._out[self._fail[child]]
+
+    def find(self, text: str):
+        """Первое найденное слово из словаря или None.
+
+        Разделитель внутри слова разбирается двумя ветками: основная склеивает
+        части («х.у.й»), вторая начинает слово заново после последнего
+        разделителя («ну,бля», «ок...хуй»).
+        """
+        main = [0, 0, ""]     # узел, позиция в слове после нормализации, прошлая буква
+        fresh = None          # ветка с начала после разделителя
+        boundary = False
+        for ch in text.lower().translate(_TABLE):
+            if ch.isspace():
+                main, fresh, boundary = [0, 0, ""], None, False
+                continue
+            if not ch.isalpha():
+                boundary = boundary or main[1] > 0
+                continue
+            if boundary:
+                fresh, boundary = [0, 0, ""], False
+            word = self._step(main, ch)
+            if word is None and fresh is not None:
+                word = self._step(fresh, ch)
+            if word is not None:
+                return word
+        return None
+
+    def _step(self, state: list, ch: str):
+        """Продвинуть ветку на букву; вернуть найденное слово"""
+        if ch == state[2]:
+            return None  # повтор буквы
+        goto, fail = self._goto, self._fail
+        node = state[0]
+        state[2] = ch
+        state[1] += 1
+        while node and ch not in goto[node]:
+            node = fail[node]
+        node = state[0] = goto[node].get(ch, 0)
+        for length, anchored, word in self._out[node]:
+            if not anchored or length == state[1]:
+                return word
+        return None
+
+    def contains(self, text: str) -> bool:
+        return bool(text) and self.find(text) is not None
+
+
+# Глобальный экземпляр
+profanity_filter = ProfanityFilter(load_words())
+
+
+if __name__ == "__main__":
+    # Бенчмарк на синтетическом корпусе: python -m services.antimat
+    import random
+    import time
+
+    random.seed(42)
+    vocabulary = ("привет как дела что нового сегодня завтра работа погода кот собака "
+                  "машина деньги встреча обновление вопрос ответ админ чат бот спасибо "
+                  "употреблять оскорблять застраховать мандарин корабль").split()
+    dirty = ["бляяя", "х.у.й", "пи3дец", "cyka", "ЗАЕБАЛ", "п*и*з*д*а", "mудak"]
+    corpus = []
+    for _ in range(50000):
+        words = random.choices(vocabulary, k=random.randint(3, 25))
+        if random.random() < 0.05:
+            words.insert(random.randrange(len(words)), random.choice(dirty))
+        corpus.append(" ".join(words))
+
+    started = time.perf_counter()
+    flagged = sum(1 for msg in corpus if profanity_filter.contains(msg))
+    elapsed = time.perf_counter() - started
+    chars = sum(map(len, corpus))
+    print(f"Сообщений: {len(corpus)}, символов: {chars}, найдено: {flagged}")
+    print(f"Время: {elapsed:.3f} с — {len(corpus) / elapsed:,.0f} сообщ/с, "
+          f"{elapsed / len(corpus) * 1e6:.1f} мкс на сообщение")
@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import time
+from collections import defaultdict, deque
+from data.database import db
+from services.outbox import outbox, SendPriority
+from utils.logger import logger
+from utils.metrics import metrics
+from config import CREATOR_ID, AD_LIMIT_PER_CHAT, AD_CONCURRENCY
+
+AD_WINDOW = 3600  # окно лимита AD_LIMIT_PER_CHAT, секунд
+
+
+class Campaign:
+    """Рекламная задача в памяти планировщика"""
+    __slots__ = ("id", "image", "text", "total", "sent", "reserved", "started", "parked")
+
+    def __init__(self, task_id: int, image: str, text: str, total: int, sent: int = 0):
+        self.id = task_id
+        self.image = image
+        self.text = text
+        self.total = total
+        self.sent = sent
+        self.reserved = sent   # отправлено + в полёте
+        self.started = None
+        self.parked = []       # чаты в запасе, пока отправки в полёте не подтверждены
+
+
+class CampaignScheduler:
+    """Событийный планировщик рекламы.
+
+    Куча (время, когда можно слать, задача, чат) вместо часового цикла:
+    пара выходит из кучи, как только чат укладывается в AD_LIMIT_PER_CHAT
+    за час, и отправляется параллельно, не более AD_CONCURRENCY за раз.
+    Состояние восстанавливается из ad_queue после перезапуска.
+    """
+
+    def __init__(self, concurrency: int = AD_CONCURRENCY, limit_per_chat: int = AD_LIMIT_PER_CHAT):
+        self.limit_per_chat = limit_per_chat
+        self._slots = asyncio.Semaphore(concurrency)
+        self._heap = []                      # (время, task_id, chat_id)
+        self._campaigns = {}                 # task_id: Campaign
+        self._windows = defaultdict(deque)   # chat_id: время последних отправок
+        self._wakeup = asyncio.Event()
+        self._loaded = False
+        self._inflight = 0
+
+    def add(self, task_id: int, image: str, text: str, total: int, chats: list):
+        """Поставить новую задачу в расписание"""
+        if not self._loaded:
+            return  # подхватится при загрузке из БД
+        self._campaigns[task_id] = Campaign(task_id, image, text, total)
+        now = time.time()
+        for chat_id in chats:
+            heapq.heappush(self._heap, (self._eligible(chat_id, now), task_id, chat_id))
+        self._wakeup.set()
+
+    async def load(self):
+        """Восстановить незавершённые задачи и окна лимитов из БД"""
+        tasks = await db.fetchall("""SELECT id, image, text, total, sent FROM ad_tasks 
+                                     WHERE status='active' AND sent < total""")
+        self._campaigns = {row[0]: Campaign(*row) for row in tasks}
+        recent = await db.fetchall("""SELECT chat_id, CAST(strftime('%s', sent_at) AS INTEGER) 
+                                      FROM ad_queue 
+                                      WHERE sent=TRUE AND sent_at > datetime('now', '-1 hour')
+                                      ORDER BY sent_at""")
+        for chat_id, sent_at in recent:
+            self._windows[chat_id].append(sent_at)
+        queue = await db.fetchall("""SELECT q.task_id, q.chat_id FROM ad_queue q 
+                                     JOIN ad_tasks t ON t.id = q.task_id 
+                                     WHERE t.status='active' AND t.sent < t.total 
+                                     AND q.sent=FALSE AND q.error IS NULL""")
+        now = time.time()
+        self._heap = [(self._eligible(chat_id, now), task_id, chat_id) for task_id, chat_id in queue]
+        heapq.heapify(self._heap)
+        self._loaded = True
+        logger.info(f"Реклама: {len(self._campaigns)} задач, {len(self._heap)} отправок в очереди")
+
+    async def run(self, bot):
+        """Основной цикл (запускать в фоне)"""
+        await self.load()
+        while True:
+            now = time.time()
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                _, task_id, chat_id = heapq.heappop(heap)
+                campaign = self._campaigns.get(task_id)
+                if campaign is None:
+                    continue  # задача выполнена — остаток очереди не нужен
+                if campaign.reserved >= campaign.total:
+                    # Места заняты отправками в полёте; если какая-то сорвётся, чат пригодится
+                    campaign.parked.append(chat_id)
+                    continue
+                ready = self._eligible(chat_id, now)
+                if ready > now:
+                    heapq.heappush(heap, (ready, task_id, chat_id))
+                    continue
+                # Место в окне и в задаче занимается до отправки
+                self._windows[chat_id].append(now)
+                campaign.reserved += 1
+                await self._slots.acquire()
+                asyncio.create_task(self._deliver(bot, campaign, chat_id, now))
+                now = time.time()
+            metrics.gauge("ads.queue_depth", len(heap))
+            timeout = max(0.0, heap[0][0] - time.time()) if heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _eligible(self, chat_id: int, now: float) -> float:
+        """Когда чат снова укладывается в лимит"""
+        window = self._windows[chat_id]
+        while window and window[0] <= now - AD_WINDOW:
+            window.popleft()
+        if len(window) < self.limit_per_chat:
+            return now
+        return window[0] + AD_WINDOW
+
+    async def _deliver(self, bot, campaign: Campaign, chat_id: int, reserved_at: float):
+        from handlers.advertising import send_ad
+
+        if campaign.started is None:
+            campaign.started = time.monotonic()
+        self._inflight += 1
+        metrics.gauge("ads.inflight", self._inflight)
+        started = time.perf_counter()
+        try:
+            success = await send_ad(bot, chat_id, campaign.image, campaign.text)
+        finally:
+            self._inflight -= 1
+            self._slots.release()
+        metrics.observe("ads.send_ms", (time.perf_counter() - started) * 1000)
+
+        if not success:
+            metrics.inc("ads.failed")
+            campaign.reserved -= 1
+            window = self._windows[chat_id]
+            if reserved_at in window:
+                window.remove(reserved_at)
+            await db.execute("UPDATE ad_queue SET error='send_failed' WHERE task_id=? AND chat_id=?",
+                             (campaign.id, chat_id))
+            # Освободилось место в задаче — возвращаем отложенные чаты в очередь
+            now = time.time()
+            for parked_chat in campaign.parked:
+                heapq.heappush(self._heap, (self._eligible(parked_chat, now), campaign.id, parked_chat))
+            campaign.parked.clear()
+            self._wakeup.set()
+            return
+
+        campaign.sent += 1
+        metrics.inc("ads.sent")
+        done = campaign.sent >= campaign.total
+        await db.run(_mark_sent, campaign.id, chat_id, done)
+        if done:
+            self._campaigns.pop(campaign.id, None)
+            elapsed = time.monotonic() - campaign.started
+            logger.info(f"Реклама #{campaign.id}: {campaign.sent} отправок за {elapsed:.0f} с "
+                        f"({campaign.sent / max(elapsed, 1e-3):.1f}/с)")
+            # Отчёт создателю
+            await outbox.send_message(bot, CREATOR_ID, f"✅ Задача #{campaign.id} выполнена полностью",
+                                      SendPriority.NOTICE)
+
+
+def _mark_sent(conn, task_id: int, chat_id: int, done: bool):
+    conn.execute("""UPDATE ad_queue SET sent=TRUE, sent_at=datetime('now')
+                    WHERE task_id=? AND chat_id=?""", (task_id, chat_id))
+    conn.execute("UPDATE ad_tasks SET sent=sent+1 WHERE id=?", (task_id,))
+    if done:
+        conn.execute("UPDATE ad_tasks SET status='completed' WHERE id=?", (task_id,))
+
+
+# Глобальный экземпляр
+campaign_scheduler = CampaignScheduler()
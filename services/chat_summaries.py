@@ -0,0 +1,83 @@
+import asyncio
+from data.database import db
+from services.llm_scheduler import llm_scheduler, Priority
+from services.memory import memory
+from services.settings import chat_settings
+from services.transcript import chat_transcript
+from services.users import user_directory
+from utils.logger import logger
+from utils.metrics import metrics
+from config import CHAT_SUMMARY_EVERY
+
+
+class ChatSummarizer:
+    """Фоновые конспекты переписки.
+
+    Каждые CHAT_SUMMARY_EVERY сообщений чата новый кусок chat_history
+    сжимается в конспект (низкий приоритет очереди модели). Прожарка
+    чата потом идёт по конспектам за весь период, а не по 100 последним
+    сообщениям.
+    """
+
+    def __init__(self, every: int = CHAT_SUMMARY_EVERY):
+        self.every = every
+        self._counters = {}  # chat_id: сообщений с последнего конспекта
+        self._running = {}   # chat_id: asyncio.Task
+
+    def observe(self, chat_id: int):
+        """Учесть сообщение; при накоплении запустить конспект в фоне"""
+        count = self._counters.get(chat_id, 0) + 1
+        if count < self.every or chat_id in self._running:
+            self._counters[chat_id] = count
+            return
+        self._counters[chat_id] = 0
+        self._running[chat_id] = asyncio.create_task(self._summarize(chat_id))
+
+    async def wait(self, chat_id: int):
+        """Дождаться конспекта, который сейчас генерируется для чата"""
+        task = self._running.get(chat_id)
+        if task is not None:
+            await task
+
+    async def since(self, chat_id: int, after_id: int) -> list:
+        """Конспекты сообщений новее after_id: [(последний id куска, текст)]"""
+        return await db.fetchall("""SELECT to_id, summary FROM chat_summaries 
+                                    WHERE chat_id=? AND to_id > ? ORDER BY to_id""",
+                                 (chat_id, after_id))
+
+    async def prune(self, chat_id: int, up_to_id: int):
+        """Удалить конспекты, уже использованные прожаркой"""
+        await db.execute("DELETE FROM chat_summaries WHERE chat_id=? AND to_id <= ?", (chat_id, up_to_id))
+
+    async def _summarize(self, chat_id: int):
+        try:
+            last_id = await db.fetchval("SELECT MAX(to_id) FROM chat_summaries WHERE chat_id=?",
+                                        (chat_id,), default=0) or 0
+            # После прожарки конспекты удалены — уже прожаренное не берём повторно
+            last_id = max(last_id, chat_settings.get(chat_id)["last_roast_message"])
+            # Не больше двух порций: после простоя не тащим всю историю
+            messages = await memory.get_chat_messages(chat_id, limit=self.every * 2, after_id=last_id)
+            if not messages:
+                return
+            names = await user_directory.resolve({msg["user_id"] for msg in messages})
+            prompt = [{
+                "role": "user",
+                "content": f"""Сожми фрагмент переписки чата в 5-8 коротких пунктов: кто что говорил, 
+                темы, глупости, споры, смешные моменты. Называй участников по именам. 
+                Это материал для будущей прожарки чата, без оценок и вступлений.
+{chat_transcript(messages, names)}"""
+            }]
+            summary = await llm_scheduler.ask(prompt, temperature=0.3, priority=Priority.BACKGROUND)
+            await db.execute("""INSERT INTO chat_summaries (chat_id, from_id, to_id, summary)
+                                VALUES (?, ?, ?, ?)""",
+                             (chat_id, messages[0]["id"], messages[-1]["id"], summary.strip()))
+            metrics.inc("chat_summaries.created")
+            metrics.observe("chat_summaries.messages", len(messages))
+        except Exception as e:
+            logger.error(f"Ошибка конспекта чата {chat_id}: {e}")
+        finally:
+            self._running.pop(chat_id, None)
+
+
+# Глобальный экземпляр
+chat_summarizer = ChatSummarizer()
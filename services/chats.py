@@ -0,0 +1,26 @@
+from data.database import db
+from utils.logger import logger
+
+
+async def backfill_chats():
+    """Один раз заполнить реестр чатов из chat_history (для существующих БД)"""
+    if await db.fetchval("SELECT 1 FROM chats LIMIT 1"):
+        return
+    if not await db.fetchval("SELECT 1 FROM chat_history LIMIT 1"):
+        return
+    await db.execute("""INSERT INTO chats (chat_id, type, first_seen, last_seen, messages)
+                        SELECT chat_id, CASE WHEN chat_id > 0 THEN 'private' END,
+                               MIN(timestamp), MAX(timestamp), COUNT(*)
+                        FROM chat_history GROUP BY chat_id""")
+    logger.info("Реестр чатов построен из истории сообщений")
+
+
+async def get_active_chats(days: int = 7) -> list:
+    """Чаты с сообщениями за последние days дней (по индексу last_seen)"""
+    rows = await db.fetchall("SELECT chat_id FROM chats WHERE last_seen > datetime('now', ?)",
+                             (f"-{days} days",))
+    return [row[0] for row in rows]
+
+
+async def count_chats() -> int:
+    return await db.fetchval("SELECT COUNT(*) FROM chats", default=0)
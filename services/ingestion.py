@@ -0,0 +1,173 @@
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime
+from data.database import db
+from services.rollups import write_rollups, prune_rollups
+from utils.logger import logger
+from utils.metrics import metrics
+from config import INGEST_BATCH_SIZE, INGEST_FLUSH_MS, INGEST_MAX_RETRIES
+
+
+class MessageIngestor:
+    """Write-behind очередь для логирования сообщений.
+
+    Вставки в chat_history и прирост activity копятся в памяти и пишутся
+    одной транзакцией каждые INGEST_BATCH_SIZE строк или INGEST_FLUSH_MS мс.
+    """
+
+    def __init__(self, batch_size: int = INGEST_BATCH_SIZE, flush_ms: int = INGEST_FLUSH_MS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self._messages = []                  # (chat_id, user_id, text, message_type, timestamp)
+        self._activity = defaultdict(int)    # (user_id, chat_id, date): прирост
+        self._chats = {}                     # chat_id: [прирост, тип, название, первое, последнее]
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._last_day = None                # для очистки агрегатов прошлых периодов
+        self._sinks = []                     # доп. записи в той же транзакции (add_sink)
+        self._failures = 0                   # неудачных записей подряд
+        self.lock = asyncio.Lock()           # одна запись в БД за раз
+
+    def log_message(self, chat_id: int, user_id: int, text: str, message_type: str = 'text',
+                    chat_type: str = None, title: str = None):
+        """Поставить сообщение в очередь (без обращения к БД)"""
+        now = datetime.utcnow()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        self._messages.append((chat_id, user_id, text, message_type, timestamp))
+        self._activity[(user_id, chat_id, now.date().isoformat())] += 1
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            self._chats[chat_id] = [1, chat_type, title, timestamp, timestamp]
+        else:
+            chat[0] += 1
+            chat[1] = chat_type or chat[1]
+            chat[2] = title or chat[2]
+            chat[4] = timestamp
+        if len(self._messages) >= self.batch_size:
+            self._wakeup.set()
+
+    def add_sink(self, sink):
+        """Подключить дополнительную запись к пакету.
+
+        sink.drain() забирает накопленное (пусто — нечего писать),
+        sink.write(conn, данные) пишет в транзакции пакета,
+        sink.restore(данные) — по желанию, возврат данных при ошибке записи.
+        """
+        self._sinks.append(sink)
+
+    @property
+    def pending(self) -> int:
+        return len(self._messages)
+
+    def pending_activity(self) -> list:
+        """Ещё не записанный прирост активности: [((user_id, chat_id, date), n)]"""
+        return list(self._activity.items())
+
+    async def flush(self):
+        """Записать всё накопленное одной транзакцией"""
+        async with self.lock:
+            messages, self._messages = self._messages, []
+            activity, self._activity = self._activity, defaultdict(int)
+            chats, self._chats = self._chats, {}
+            payloads = [(sink, sink.drain()) for sink in self._sinks]
+            payloads = [(sink, payload) for sink, payload in payloads if payload]
+            if not messages and not payloads:
+                return
+            started = time.perf_counter()
+            today = datetime.utcnow().date()
+            prune = today != self._last_day
+            try:
+                await db.run(_write_batch, messages, activity, chats,
+                             today if prune else None, payloads)
+            except Exception as e:
+                self._failures += 1
+                if self._failures > INGEST_MAX_RETRIES:
+                    # Отбрасываем пакет целиком, включая данные sink-ов:
+                    # иначе «ядовитая» запись валила бы и все следующие пакеты
+                    self._failures = 0
+                    metrics.inc("ingest.dropped", len(messages))
+                    metrics.inc("ingest.sink_dropped", len(payloads))
+                    logger.error(f"Пакет сообщений ({len(messages)}) и записей sink-ов "
+                                 f"({len(payloads)}) отброшен после повторов: {e}")
+                    return
+                # Вернуть пакет в начало очереди — запишется со следующим
+                self._restore(messages, activity, chats)
+                for sink, payload in payloads:
+                    if hasattr(sink, "restore"):
+                        sink.restore(payload)
+                metrics.inc("ingest.retries")
+                logger.warning(f"Не удалось записать пакет сообщений ({len(messages)}), повторим: {e}")
+                return
+            self._failures = 0
+            self._last_day = today
+            metrics.observe("ingest.flush_ms", (time.perf_counter() - started) * 1000)
+            if messages:
+                metrics.inc("ingest.messages", len(messages))
+                metrics.observe("ingest.batch_size", len(messages))
+
+    def _restore(self, messages: list, activity: dict, chats: dict):
+        self._messages[:0] = messages
+        for key, count in activity.items():
+            self._activity[key] += count
+        for chat_id, (count, chat_type, title, first_seen, last_seen) in chats.items():
+            newer = self._chats.get(chat_id)
+            if newer is None:
+                self._chats[chat_id] = [count, chat_type, title, first_seen, last_seen]
+            else:
+                newer[0] += count
+                newer[1] = newer[1] or chat_type
+                newer[2] = newer[2] or title
+                newer[3] = first_seen
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        """Запустить фоновую запись"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую запись и сбросить остаток на диск"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+def _write_batch(conn, messages, activity, chats, prune_day=None, payloads=()):
+    conn.executemany("""INSERT INTO chat_history (chat_id, user_id, text, message_type, timestamp)
+                        VALUES (?, ?, ?, ?, ?)""", messages)
+    conn.executemany("""INSERT INTO activity (user_id, chat_id, date, messages)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(user_id, chat_id, date)
+                        DO UPDATE SET messages = messages + excluded.messages""",
+                     [(*key, count) for key, count in activity.items()])
+    conn.executemany("""INSERT INTO chats (chat_id, messages, type, title, first_seen, last_seen)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(chat_id) DO UPDATE SET
+                            messages = messages + excluded.messages,
+                            type = COALESCE(excluded.type, type),
+                            title = COALESCE(excluded.title, title),
+                            last_seen = excluded.last_seen""",
+                     [(chat_id, *chat) for chat_id, chat in chats.items()])
+    write_rollups(conn, activity)
+    if prune_day is not None:
+        prune_rollups(conn, prune_day)
+    for sink, payload in payloads:
+        sink.write(conn, payload)
+
+
+# Глобальный экземпляр
+ingestor = MessageIngestor()
@@ -0,0 +1,140 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import date
+from data.database import db
+from services.ingestion import ingestor
+from services.rollups import PERIODS, period_buckets, current_bucket
+from config import LEADERBOARD_MAX_CHATS
+
+
+class Board:
+    """Рейтинг одного чата за один период: top N и место любого участника.
+
+    Счётчики участников лежат ещё и отсортированным списком, так что место —
+    это bisect, а память и время зависят от числа участников, а не от
+    величины счётчиков. Обычное +1 правит список на месте за O(log n);
+    сдвиг списка остаётся только для новых участников и пачек из очереди.
+    """
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+        self.counts = {}     # user_id: сообщений
+        self.by_count = {}   # сообщений: set(user_id)
+        self._sorted = []    # счётчики всех участников по возрастанию
+
+    def load(self, rows):
+        """Заполнить пустой рейтинг пачкой (user_id, сообщений) за один проход"""
+        for user_id, count in rows:
+            if count:
+                self.counts[user_id] = self.counts.get(user_id, 0) + count
+        for user_id, count in self.counts.items():
+            self.by_count.setdefault(count, set()).add(user_id)
+        self._sorted = sorted(self.counts.values())
+
+    def increment(self, user_id: int, delta: int = 1):
+        old = self.counts.get(user_id, 0)
+        new = old + delta
+        if old:
+            users = self.by_count[old]
+            users.discard(user_id)
+            if not users:
+                del self.by_count[old]
+            if delta == 1:
+                # Последний old -> old + 1: порядок сохраняется, сдвига списка нет
+                self._sorted[bisect_right(self._sorted, old) - 1] = new
+            else:
+                del self._sorted[bisect_left(self._sorted, old)]
+                insort(self._sorted, new)
+        else:
+            insort(self._sorted, new)
+        self.counts[user_id] = new
+        self.by_count.setdefault(new, set()).add(user_id)
+
+    def rank(self, user_id: int):
+        """(место, сообщений); место = 1 + число участников строго выше"""
+        count = self.counts.get(user_id, 0)
+        if not count:
+            return None, 0
+        above = len(self._sorted) - bisect_right(self._sorted, count)
+        return above + 1, count
+
+    def top(self, n: int = 10) -> list:
+        result = []
+        end = len(self._sorted)
+        while end and len(result) < n:
+            count = self._sorted[end - 1]
+            users = sorted(self.by_count[count])
+            result.extend((user_id, count) for user_id in users[:n - len(result)])
+            end = bisect_left(self._sorted, count)
+        return result
+
+
+class Leaderboards:
+    """Рейтинги чатов по периодам, синхронные с потоком сообщений.
+
+    Чат загружается из activity_rollups при первом запросе (плюс ещё не
+    записанные в БД сообщения из очереди), дальше обновляется в памяти.
+    """
+
+    def __init__(self, max_chats: int = LEADERBOARD_MAX_CHATS):
+        self.max_chats = max_chats
+        self._chats = OrderedDict()  # chat_id: {period: Board}
+
+    def record(self, chat_id: int, user_id: int):
+        """Учесть сообщение (только для уже загруженных чатов)"""
+        boards = self._chats.get(chat_id)
+        if boards is None:
+            return
+        for period in PERIODS:
+            self._board(boards, period).increment(user_id)
+
+    async def top(self, chat_id: int, period: str = 'all', n: int = 10) -> list:
+        boards = await self._load(chat_id)
+        return self._board(boards, period).top(n)
+
+    async def rank(self, chat_id: int, period: str, user_id: int):
+        boards = await self._load(chat_id)
+        return self._board(boards, period).rank(user_id)
+
+    @staticmethod
+    def _board(boards: dict, period: str) -> Board:
+        bucket = current_bucket(period)
+        board = boards[period]
+        if board.bucket != bucket:  # начались новые сутки/неделя/месяц
+            board = boards[period] = Board(bucket)
+        return board
+
+    async def _load(self, chat_id: int) -> dict:
+        boards = self._chats.get(chat_id)
+        if boards is not None:
+            self._chats.move_to_end(chat_id)
+            return boards
+
+        buckets = {period: current_bucket(period) for period in PERIODS}
+        # Блокировка очереди: пока читаем БД, пакет не может записаться «между» чтениями
+        async with ingestor.lock:
+            boards = self._chats.get(chat_id)
+            if boards is not None:  # загрузил параллельный запрос
+                return boards
+            rows = await db.fetchall("""SELECT period, bucket, user_id, messages FROM activity_rollups
+                                        WHERE chat_id=? AND bucket IN (?, ?, ?, ?)""",
+                                     (chat_id, *buckets.values()))
+            boards = {period: Board(bucket) for period, bucket in buckets.items()}
+            for period, board in boards.items():
+                board.load((user_id, messages) for row_period, bucket, user_id, messages in rows
+                           if row_period == period and bucket == board.bucket)
+            # Сообщения, ещё не записанные в БД
+            for (user_id, pending_chat, day), count in ingestor.pending_activity():
+                if pending_chat != chat_id:
+                    continue
+                for period, bucket in period_buckets(date.fromisoformat(day)).items():
+                    if buckets[period] == bucket:
+                        boards[period].increment(user_id, count)
+            self._chats[chat_id] = boards
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+        return boards
+
+
+# Глобальный экземпляр
+leaderboards = Leaderboards()
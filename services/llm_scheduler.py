@@ -0,0 +1,147 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+import aiohttp
+from services.ai_client import groq_client
+from utils.helpers import estimate_tokens
+from utils.logger import logger
+from utils.metrics import metrics
+from utils.rate_limit import TokenBucket
+from config import LLM_CONCURRENCY, LLM_RPM, LLM_TPM, LLM_RESPONSE_TOKENS
+
+
+class Priority(IntEnum):
+    """Классы приоритета: меньше — важнее"""
+    ASSISTANT = 0    # ассистент в ЛС
+    COMMAND = 1      # явные команды (/ты_кто, /прожарь, /статус)
+    MENTION = 2      # упоминание бота
+    QUESTION = 3     # ответы на вопросы в чате
+    PROVOCATION = 4  # провокации, конфликты, прожарка чата
+    BACKGROUND = 5   # фоновые задачи (резюме диалогов)
+
+
+class LLMScheduler:
+    """Центральная очередь запросов к модели.
+
+    Ограничивает число одновременных запросов и держит RPM/TPM в рамках
+    лимитов Groq; при нехватке ресурса первым проходит самый важный запрос.
+    """
+
+    def __init__(self, concurrency: int = LLM_CONCURRENCY, rpm: int = LLM_RPM, tpm: int = LLM_TPM):
+        self.concurrency = concurrency
+        # Бакеты на ~10 секунд запаса, чтобы не выстреливать минутный лимит залпом
+        self._requests = TokenBucket(rpm / 60, max(1, rpm / 6))
+        self._tokens = TokenBucket(tpm / 60, max(LLM_RESPONSE_TOKENS, tpm / 6))
+        self._heap = []  # (priority, seq, future, tokens)
+        self._seq = itertools.count()
+        self._active = 0
+        self._timer = None
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, tokens: int):
+        """Дождаться своей очереди и занять слот на время запроса"""
+        await self._acquire(priority, tokens)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def ask(self, messages: list, temperature: float = 0.85,
+                  priority: Priority = Priority.COMMAND, retries: int = 2) -> str:
+        """ask_groq через очередь с приоритетом"""
+        tokens = _estimate(messages)
+        for attempt in range(retries + 1):
+            try:
+                async with self.slot(priority, tokens):
+                    return await groq_client.ask(messages, temperature)
+            except aiohttp.ClientResponseError as e:
+                self._backoff(e, attempt == retries)
+
+    async def stream(self, messages: list, temperature: float = 0.85,
+                     priority: Priority = Priority.COMMAND, retries: int = 2):
+        """Потоковый ответ через очередь; слот занят, пока идёт генерация"""
+        tokens = _estimate(messages)
+        for attempt in range(retries + 1):
+            try:
+                async with self.slot(priority, tokens):
+                    # 429 приходит до первого куска, поэтому повтор безопасен
+                    async for chunk in groq_client.stream(messages, temperature):
+                        yield chunk
+                return
+            except aiohttp.ClientResponseError as e:
+                self._backoff(e, attempt == retries)
+
+    def _backoff(self, error: aiohttp.ClientResponseError, last_attempt: bool):
+        """На 429 притормозить весь поток запросов, иначе пробросить ошибку"""
+        if error.status != 429 or last_attempt:
+            raise error
+        retry_after = float((error.headers or {}).get("Retry-After", 5))
+        metrics.inc("llm.rate_limited")
+        logger.warning(f"Groq 429, пауза {retry_after:.0f} с")
+        self._requests.pause(retry_after)
+
+    async def _acquire(self, priority: Priority, tokens: int):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        enqueued = time.perf_counter()
+        heapq.heappush(self._heap, (int(priority), next(self._seq), future, tokens))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Слот мог быть выдан одновременно с отменой — вернём его
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                future.cancel()
+            raise
+        wait_ms = (time.perf_counter() - enqueued) * 1000
+        metrics.observe("llm.wait_ms", wait_ms)
+        metrics.observe(f"llm.wait_ms.{Priority(priority).name.lower()}", wait_ms)
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Выдать слоты ожидающим, пока позволяют лимиты"""
+        heap = self._heap
+        while heap and self._active < self.concurrency:
+            priority, seq, future, tokens = heap[0]
+            if future.done():  # запрос отменён, пока ждал
+                heapq.heappop(heap)
+                continue
+            delay = max(self._requests.delay(1), self._tokens.delay(tokens))
+            if delay > 0:
+                self._schedule(delay)
+                break
+            heapq.heappop(heap)
+            self._requests.consume(1)
+            self._tokens.consume(tokens)
+            self._active += 1
+            future.set_result(None)
+        metrics.gauge("llm.queue_depth", len(heap))
+        metrics.gauge("llm.active", self._active)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            return
+        loop = asyncio.get_running_loop()
+
+        def wake():
+            self._timer = None
+            self._dispatch()
+
+        self._timer = loop.call_later(delay, wake)
+
+
+def _estimate(messages: list) -> int:
+    """Оценка токенов запроса вместе с ответом"""
+    return sum(estimate_tokens(m["content"]) for m in messages) + LLM_RESPONSE_TOKENS
+
+
+# Глобальный экземпляр
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+from io import BytesIO
+from pathlib import Path
+from aiogram.types import FSInputFile
+from data.database import db
+from utils.metrics import metrics
+from config import MEDIA_DIR
+
+
+class MediaStore:
+    """Медиафайлы по хэшу содержимого: data/media/<sha256>.jpg.
+
+    Одинаковая картинка хранится один раз, а в Telegram загружается только
+    при первой отправке — дальше рассылается по file_id.
+    """
+
+    def __init__(self, root: str = MEDIA_DIR):
+        self.root = Path(root)
+        self._file_ids = {}   # путь: file_id
+        self._locks = {}      # путь: asyncio.Lock первой загрузки
+
+    async def save_photo(self, bot, photo):
+        """Сохранить фото из сообщения; вернуть путь к файлу"""
+        buffer = BytesIO()
+        await bot.download(photo, destination=buffer)
+        content = buffer.getvalue()
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.root / f"{digest}.jpg"
+        if not path.exists():
+            await asyncio.to_thread(_write_file, path, content)
+
+        known = await db.fetchval("SELECT file_id FROM media_files WHERE sha256=?", (digest,))
+        if known:
+            metrics.inc("media.dedup")
+        # file_id входящего фото годится для повторной отправки этим же ботом
+        file_id = known or photo.file_id
+        await db.execute("""INSERT INTO media_files (sha256, path, file_id) VALUES (?, ?, ?)
+                            ON CONFLICT(sha256) DO UPDATE SET file_id=excluded.file_id""",
+                         (digest, str(path), file_id))
+        self._file_ids[str(path)] = file_id
+        return str(path)
+
+    async def send_photo(self, bot, chat_id: int, path: str, caption: str = None):
+        """Отправить фото: по file_id, а если его ещё нет — загрузить один раз"""
+        file_id = await self._file_id(path)
+        if file_id:
+            metrics.inc("media.reused")
+            return await bot.send_photo(chat_id, file_id, caption=caption)
+
+        lock = self._locks.setdefault(path, asyncio.Lock())
+        async with lock:  # параллельные отправки ждут первую загрузку
+            file_id = self._file_ids.get(path)
+            if file_id:
+                metrics.inc("media.reused")
+                return await bot.send_photo(chat_id, file_id, caption=caption)
+            message = await bot.send_photo(chat_id, FSInputFile(path), caption=caption)
+            metrics.inc("media.uploads")
+            await self._remember(path, message.photo[-1].file_id)
+            return message
+
+    async def _file_id(self, path: str):
+        if path not in self._file_ids:
+            self._file_ids[path] = await db.fetchval(
+                """SELECT file_id FROM media_files WHERE path=? 
+                   UNION ALL SELECT file_id FROM ad_tasks WHERE image=? AND file_id IS NOT NULL
+                   LIMIT 1""", (path, path))
+        return self._file_ids[path]
+
+    async def _remember(self, path: str, file_id: str):
+        self._file_ids[path] = file_id
+        digest = await asyncio.to_thread(_file_hash, path)
+
+        def write(conn):
+            conn.execute("""INSERT INTO media_files (sha256, path, file_id) VALUES (?, ?, ?)
+                            ON CONFLICT(sha256) DO UPDATE SET file_id=excluded.file_id""",
+                         (digest, path, file_id))
+            conn.execute("UPDATE ad_tasks SET file_id=? WHERE image=?", (file_id, path))
+
+        await db.run(write)
+
+
+def _write_file(path: Path, content: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+
+
+def _file_hash(path: str) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+# Глобальный экземпляр
+media_store = MediaStore()
@@ -1,31 +1,53 @@
+import asyncio
 import sqlite3
-import json
+import time
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-from config import DB_PATH
+from config import (DB_PATH, CONTEXT_SIZE, CONTEXT_CACHE_CHATS, CONTEXT_TOKEN_BUDGET,
+                    CONTEXT_WINDOW_TOKENS, CONTEXT_SUMMARY_TOKENS, CONTEXT_SUMMARY_RETRY)
+from data.database import db
+from services.ingestion import ingestor
+from services.llm_scheduler import llm_scheduler, Priority
+from services.profiles import profile_store
+from utils.helpers import estimate_tokens
+from utils.logger import logger
+from utils.metrics import metrics
 
 class Memory:
     def __init__(self):
-        self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
         self.create_tables()
+        # Контекст диалогов: последние CONTEXT_SIZE реплик чата в памяти,
+        # запись в БД — пакетом вместе с очередью сообщений (см. drain/write)
+        self._contexts = OrderedDict()  # chat_id: deque({"role", "content"})
+        self._pending = []              # (chat_id, role, content) ещё не в БД
+        # Реплики, выпавшие из окна, сворачиваются в резюме фоновым запросом
+        self._summaries = {}            # chat_id: резюме старой части диалога
+        self._folded = {}               # chat_id: [реплики, ещё не вошедшие в резюме]
+        self._summarizing = {}          # chat_id: asyncio.Task
+        self._retry_at = {}             # chat_id: когда можно повторить неудавшееся резюме
+        ingestor.add_sink(self)
 
     def create_tables(self):
-        """Создание таблиц, если их нет"""
-        c = self.conn.cursor()
+        """Создание таблиц, если их нет (один раз при старте)"""
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
         # Контекстная память для чатов
         c.execute('''CREATE TABLE IF NOT EXISTS context_memory (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             chat_id INTEGER,
             role TEXT CHECK(role IN ('user', 'assistant', 'system')),
             content TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(chat_id, role, content)
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )''')
-        # Персональные анкеты (расширенные)
-        c.execute('''CREATE TABLE IF NOT EXISTS personal_profiles (
-            user_id INTEGER PRIMARY KEY,
-            data TEXT,  -- JSON с анкетой
+        _drop_context_unique(c)
+        # Резюме старой части диалога (для бюджета токенов)
+        c.execute('''CREATE TABLE IF NOT EXISTS context_summaries (
+            chat_id INTEGER PRIMARY KEY,
+            summary TEXT,
             updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )''')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_context_chat 
+                     ON context_memory(chat_id, id)''')
         # Кэш прожарок
         c.execute('''CREATE TABLE IF NOT EXISTS roast_cache (
             target_id INTEGER,
@@ -34,104 +56,212 @@ class Memory:
             created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             PRIMARY KEY(target_id, chat_id)
         )''')
-        self.conn.commit()
+        conn.commit()
+        conn.close()
 
     # === Работа с контекстом ===
-    def add_context(self, chat_id: int, role: str, content: str):
-        """Добавить сообщение в контекст"""
-        c = self.conn.cursor()
-        # Ограничиваем историю 20 последними сообщениями
-        c.execute("SELECT COUNT(*) FROM context_memory WHERE chat_id=?", (chat_id,))
-        count = c.fetchone()[0]
-        if count >= 20:
-            c.execute("""DELETE FROM context_memory WHERE id IN (
-                SELECT id FROM context_memory WHERE chat_id=? ORDER BY id ASC LIMIT ?
-            )""", (chat_id, count - 15))
-        c.execute("""INSERT INTO context_memory (chat_id, role, content)
-                     VALUES (?, ?, ?)""",
-                  (chat_id, role, content))
-        self.conn.commit()
-
-    def get_context(self, chat_id: int, limit: int = 10) -> list:
-        """Получить историю диалога для чата"""
-        c = self.conn.cursor()
-        c.execute("""SELECT role, content FROM context_memory 
-                     WHERE chat_id=? ORDER BY id DESC LIMIT ?""",
-                  (chat_id, limit))
-        rows = c.fetchall()
-        # Возвращаем в правильном порядке (старые -> новые)
-        history = [{"role": role, "content": content} for role, content in reversed(rows)]
-        return history
-
-    def clear_context(self, chat_id: int):
+    async def add_context(self, chat_id: int, role: str, content: str):
+        """Добавить сообщение в контекст (в БД попадёт со следующим пакетом)"""
+        context = await self._context(chat_id)
+        context.append({"role": role, "content": content})
+        self._pending.append((chat_id, role, content))
+        folded = self._folded.setdefault(chat_id, [])
+        while len(context) > 2 and (len(context) > CONTEXT_SIZE or _tokens(context) > CONTEXT_WINDOW_TOKENS):
+            folded.append(context.popleft())
+        # Сворачиваем порциями в пол-окна, а не на каждую реплику
+        # Пока модель недоступна, копим не больше окна — старейшее теряется
+        while _tokens(folded) > CONTEXT_WINDOW_TOKENS and len(folded) > 1:
+            folded.pop(0)
+        if (_tokens(folded) >= CONTEXT_WINDOW_TOKENS // 2 and chat_id not in self._summarizing
+                and time.monotonic() >= self._retry_at.get(chat_id, 0)):
+            self._summarizing[chat_id] = asyncio.create_task(self._summarize(chat_id))
+
+    async def build_context(self, chat_id: int, system_prompt: dict, text: str,
+                            budget: int = CONTEXT_TOKEN_BUDGET) -> list:
+        """Сообщения для модели в рамках бюджета токенов:
+        системный промпт, резюме старой части, свежие реплики, новый вопрос"""
+        context = await self._context(chat_id)
+        head = [system_prompt]
+        used = estimate_tokens(system_prompt["content"]) + estimate_tokens(text)
+        summary = self._summaries.get(chat_id)
+        if summary:
+            head.append({"role": "system", "content": f"Краткое содержание предыдущего разговора: {summary}"})
+            used += estimate_tokens(head[-1]["content"])
+        turns = []
+        for turn in reversed(context):
+            tokens = estimate_tokens(turn["content"])
+            if used + tokens > budget:
+                break
+            turns.append(turn)
+            used += tokens
+        metrics.observe("context.prompt_tokens", used)
+        return head + turns[::-1] + [{"role": "user", "content": text}]
+
+    async def _summarize(self, chat_id: int):
+        """Свернуть выпавшие из окна реплики в резюме (низкий приоритет)"""
+        folded = self._folded.pop(chat_id, [])
+        try:
+            dialog = "\n".join(f"{turn['role']}: {turn['content']}" for turn in folded)
+            previous = self._summaries.get(chat_id) or "нет"
+            prompt = [{
+                "role": "user",
+                "content": f"""Обнови краткое резюме диалога пользователя с ассистентом. 
+                Сохрани факты о пользователе, его задачи и договорённости, без воды. 
+                Не больше {CONTEXT_SUMMARY_TOKENS * 2} символов.
+                Текущее резюме: {previous}
+                Новые реплики:
+                {dialog}"""
+            }]
+            summary = await llm_scheduler.ask(prompt, temperature=0.3, priority=Priority.BACKGROUND)
+            summary = summary.strip()[:CONTEXT_SUMMARY_TOKENS * 3]
+            await db.execute("""INSERT INTO context_summaries (chat_id, summary) VALUES (?, ?)
+                                ON CONFLICT(chat_id) DO UPDATE SET 
+                                    summary=excluded.summary, updated=CURRENT_TIMESTAMP""",
+                             (chat_id, summary))
+            self._summaries[chat_id] = summary
+            self._retry_at.pop(chat_id, None)
+            metrics.inc("context.summaries")
+        except Exception as e:
+            # Не удалось — реплики попадут в следующую попытку
+            self._folded[chat_id] = folded + self._folded.get(chat_id, [])
+            self._retry_at[chat_id] = time.monotonic() + CONTEXT_SUMMARY_RETRY
+            metrics.inc("context.summary_errors")
+            logger.error(f"Ошибка резюме контекста {chat_id}: {e}")
+        finally:
+            self._summarizing.pop(chat_id, None)
+
+    async def get_context(self, chat_id: int, limit: int = 10) -> list:
+        """Получить историю диалога для чата (старые -> новые)"""
+        context = await self._context(chat_id)
+        return list(context)[-limit:]
+
+    async def clear_context(self, chat_id: int):
         """Очистить контекст для чата"""
-        c = self.conn.cursor()
-        c.execute("DELETE FROM context_memory WHERE chat_id=?", (chat_id,))
-        self.conn.commit()
+        async with ingestor.lock:  # чтобы пакет в полёте не вернул удалённое
+            self._contexts.pop(chat_id, None)
+            self._summaries.pop(chat_id, None)
+            self._folded.pop(chat_id, None)
+            self._retry_at.pop(chat_id, None)
+            task = self._summarizing.pop(chat_id, None)
+            if task is not None:
+                task.cancel()
+            self._pending = [item for item in self._pending if item[0] != chat_id]
+
+            def delete(conn):
+                conn.execute("DELETE FROM context_memory WHERE chat_id=?", (chat_id,))
+                conn.execute("DELETE FROM context_summaries WHERE chat_id=?", (chat_id,))
+
+            await db.run(delete)
+
+    async def _context(self, chat_id: int) -> deque:
+        context = self._contexts.get(chat_id)
+        if context is not None:
+            self._contexts.move_to_end(chat_id)
+            return context
+        # Промах кэша: БД плюс ещё не записанные реплики
+        async with ingestor.lock:
+            context = self._contexts.get(chat_id)
+            if context is not None:
+                return context
+            rows = await db.fetchall("""SELECT role, content FROM context_memory 
+                                        WHERE chat_id=? ORDER BY id DESC LIMIT ?""",
+                                     (chat_id, CONTEXT_SIZE))
+            context = deque({"role": role, "content": content} for role, content in reversed(rows))
+            context.extend({"role": role, "content": content}
+                           for pending_chat, role, content in self._pending if pending_chat == chat_id)
+            # Старшие реплики из БД уже учтены в резюме (или потеряны при перезапуске)
+            while len(context) > CONTEXT_SIZE or (len(context) > 2 and _tokens(context) > CONTEXT_WINDOW_TOKENS):
+                context.popleft()
+            summary = await db.fetchval("SELECT summary FROM context_summaries WHERE chat_id=?", (chat_id,))
+            if summary:
+                self._summaries[chat_id] = summary
+            self._contexts[chat_id] = context
+        while len(self._contexts) > CONTEXT_CACHE_CHATS:
+            evicted, _ = self._contexts.popitem(last=False)
+            self._summaries.pop(evicted, None)
+            self._folded.pop(evicted, None)
+            self._retry_at.pop(evicted, None)
+        return context
+
+    # Запись пакетом (через ingestor)
+    def drain(self) -> list:
+        pending, self._pending = self._pending, []
+        return pending
+
+    def write(self, conn, rows: list):
+        conn.executemany("INSERT INTO context_memory (chat_id, role, content) VALUES (?, ?, ?)", rows)
+        # Обрезка одним запросом на чат: оставляем последние CONTEXT_SIZE реплик
+        conn.executemany("""DELETE FROM context_memory WHERE chat_id=? AND id <= (
+                                SELECT id FROM context_memory WHERE chat_id=? 
+                                ORDER BY id DESC LIMIT 1 OFFSET ?)""",
+                         [(chat_id, chat_id, CONTEXT_SIZE) for chat_id in {row[0] for row in rows}])
+
+    def restore(self, rows: list):
+        self._pending[:0] = rows
 
     # === Профили пользователей ===
-    def save_profile(self, user_id: int, data: dict):
+    # Анкеты хранит profile_store (таблица personal_profiles из data/models.py)
+    async def save_profile(self, user_id: int, data: dict):
         """Сохранить анкету пользователя"""
-        c = self.conn.cursor()
-        json_data = json.dumps(data, ensure_ascii=False)
-        c.execute("""INSERT OR REPLACE INTO personal_profiles (user_id, data)
-                     VALUES (?, ?)""", (user_id, json_data))
-        self.conn.commit()
-
-    def load_profile(self, user_id: int) -> dict:
-        """Загрузить анкету пользователя"""
-        c = self.conn.cursor()
-        c.execute("SELECT data FROM personal_profiles WHERE user_id=?", (user_id,))
-        row = c.fetchone()
-        if row:
-            return json.loads(row[0])
-        return {}
-
-    def get_profile_field(self, user_id: int, field: str):
+        await profile_store.save(user_id, data)
+
+    async def load_profile(self, user_id: int) -> dict:
+        """Загрузить анкету пользователя (из кэша)"""
+        return await profile_store.get(user_id)
+
+    async def get_profile_field(self, user_id: int, field: str):
         """Получить конкретное поле из профиля"""
-        profile = self.load_profile(user_id)
+        profile = await self.load_profile(user_id)
         return profile.get(field)
 
     # === Прожарки ===
-    def cache_roast(self, target_id: int, chat_id: int, roast_text: str):
+    async def cache_roast(self, target_id: int, chat_id: int, roast_text: str):
         """Кэшировать прожарку"""
-        c = self.conn.cursor()
-        c.execute("""INSERT OR REPLACE INTO roast_cache (target_id, chat_id, roast_text)
-                     VALUES (?, ?, ?)""", (target_id, chat_id, roast_text))
-        self.conn.commit()
+        await db.execute("""INSERT OR REPLACE INTO roast_cache (target_id, chat_id, roast_text)
+                            VALUES (?, ?, ?)""", (target_id, chat_id, roast_text))
 
-    def get_cached_roast(self, target_id: int, chat_id: int) -> str:
+    async def get_cached_roast(self, target_id: int, chat_id: int) -> str:
         """Получить закэшированную прожарку (если свежая)"""
-        c = self.conn.cursor()
-        c.execute("""SELECT roast_text FROM roast_cache 
-                     WHERE target_id=? AND chat_id=? 
-                     AND created > datetime('now', '-1 hour')""",
-                  (target_id, chat_id))
-        row = c.fetchone()
-        return row[0] if row else None
+        return await db.fetchval("""SELECT roast_text FROM roast_cache 
+                                    WHERE target_id=? AND chat_id=? 
+                                    AND created > datetime('now', '-1 hour')""",
+                                 (target_id, chat_id))
 
     # === Активность (для прожарки чата) ===
-    def get_chat_messages(self, chat_id: int, limit: int = 1000) -> list:
-        """Получить последние сообщения чата"""
-        c = self.conn.cursor()
-        c.execute("""SELECT user_id, text, timestamp FROM chat_history 
-                     WHERE chat_id=? ORDER BY id DESC LIMIT ?""",
-                  (chat_id, limit))
-        rows = c.fetchall()
-        return [{"user_id": r[0], "text": r[1], "time": r[2]} for r in reversed(rows)]
-
-    def get_user_messages(self, user_id: int, chat_id: int, limit: int = 50) -> list:
+    async def get_chat_messages(self, chat_id: int, limit: int = 1000, after_id: int = 0) -> list:
+        """Получить последние сообщения чата (только новее after_id)"""
+        rows = await db.fetchall("""SELECT id, user_id, text, timestamp FROM chat_history 
+                                    WHERE chat_id=? AND id > ? ORDER BY id DESC LIMIT ?""",
+                                 (chat_id, after_id, limit))
+        return [{"id": r[0], "user_id": r[1], "text": r[2], "time": r[3]} for r in reversed(rows)]
+
+    async def get_user_messages(self, user_id: int, chat_id: int, limit: int = 50) -> list:
         """Получить сообщения конкретного пользователя"""
-        c = self.conn.cursor()
-        c.execute("""SELECT text FROM chat_history 
-                     WHERE user_id=? AND chat_id=? 
-                     ORDER BY id DESC LIMIT ?""",
-                  (user_id, chat_id, limit))
-        return [row[0] for row in c.fetchall()]
-
-    def close(self):
-        """Закрыть соединение"""
-        self.conn.close()
+        rows = await db.fetchall("""SELECT text FROM chat_history 
+                                    WHERE user_id=? AND chat_id=? 
+                                    ORDER BY id DESC LIMIT ?""",
+                                 (user_id, chat_id, limit))
+        return [row[0] for row in rows]
+
+def _tokens(turns) -> int:
+    return sum(estimate_tokens(turn["content"]) for turn in turns)
+
+def _drop_context_unique(c):
+    """Старые базы: UNIQUE(chat_id, role, content) не давал повторить реплику — пересоздаём таблицу"""
+    row = c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='context_memory'").fetchone()
+    if not row or "UNIQUE" not in row[0]:
+        return
+    c.execute('''CREATE TABLE context_memory_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER,
+        role TEXT CHECK(role IN ('user', 'assistant', 'system')),
+        content TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    c.execute('''INSERT INTO context_memory_new (id, chat_id, role, content, timestamp)
+                 SELECT id, chat_id, role, content, timestamp FROM context_memory''')
+    c.execute("DROP TABLE context_memory")
+    c.execute("ALTER TABLE context_memory_new RENAME TO context_memory")
 
 # Глобальный экземпляр
 memory = Memory()
\ No newline at end of file
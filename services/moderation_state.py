@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict, deque
+from config import SPAM_REPEAT_LIMIT, MODERATION_IDLE_TTL, MODERATION_MAX_USERS
+
+MEDIA_TYPES = ("sticker", "gif")
+
+
+class UserState:
+    """Состояние автомодерации одного пользователя в одном чате"""
+    __slots__ = ("media_streak", "recent", "last_seen")
+
+    def __init__(self):
+        self.media_streak = 0                            # стикеров/гифок подряд
+        self.recent = deque(maxlen=SPAM_REPEAT_LIMIT * 3)  # (hash текста, время)
+        self.last_seen = 0.0
+
+    def repeats(self, text_hash: int, since: float) -> int:
+        """Сколько раз текст встречался в окне"""
+        return sum(1 for h, ts in self.recent if h == text_hash and ts >= since)
+
+
+class ModerationState:
+    """Потоковое состояние для auto_moderate: обновляется прямо из апдейта,
+    без запросов к chat_history. Неактивные записи вытесняются."""
+
+    def __init__(self, idle_ttl: float = MODERATION_IDLE_TTL, max_entries: int = MODERATION_MAX_USERS):
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        self._states = OrderedDict()  # (chat_id, user_id): UserState, старые — в начале
+
+    def observe(self, chat_id: int, user_id: int, text: str, message_type: str) -> UserState:
+        """Учесть новое сообщение и вернуть обновлённое состояние"""
+        now = time.monotonic()
+        key = (chat_id, user_id)
+        state = self._states.pop(key, None) or UserState()
+        self._states[key] = state
+        state.last_seen = now
+
+        if message_type in MEDIA_TYPES:
+            state.media_streak += 1
+        else:
+            state.media_streak = 0
+        if text:
+            state.recent.append((hash(text), now))
+
+        self._evict(now)
+        return state
+
+    def get(self, chat_id: int, user_id: int) -> UserState:
+        return self._states.get((chat_id, user_id))
+
+    def _evict(self, now: float):
+        states = self._states
+        deadline = now - self.idle_ttl
+        while states:
+            key, state = next(iter(states.items()))
+            if state.last_seen >= deadline and len(states) <= self.max_entries:
+                break
+            del states[key]
+
+    def __len__(self):
+        return len(self._states)
+
+
+# Глобальный экземпляр
+moderation_state = ModerationState()
@@ -1,8 +1,13 @@
-import sqlite3
+import time
 from datetime import datetime, timedelta
 from aiogram import Bot
 from aiogram.types import ChatPermissions
-from config import DB_PATH
+from data.database import db
+from services.moderation_state import moderation_state
+from services.antimat import profanity_filter
+from utils.logger import logger
+from utils.metrics import metrics
+from config import FLOOD_LIMIT, SPAM_REPEAT_LIMIT, SPAM_WINDOW_SEC
 
 class Moderator:
     def __init__(self, bot: Bot):
@@ -11,13 +16,9 @@ class Moderator:
     async def mute_user(self, chat_id: int, user_id: int, minutes: int, reason: str = ""):
         """Выдать мут"""
         until = datetime.now() + timedelta(minutes=minutes)
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""INSERT INTO moderations (chat_id, user_id, type, expires, reason)
-                     VALUES (?, ?, 'mute', ?, ?)""",
-                  (chat_id, user_id, until.isoformat(), reason))
-        conn.commit()
-        conn.close()
+        await db.execute("""INSERT INTO moderations (chat_id, user_id, type, expires, reason)
+                              VALUES (?, ?, 'mute', ?, ?)""",
+                         (chat_id, user_id, until.isoformat(), reason))
 
         await self.bot.restrict_chat_member(
             chat_id=chat_id,
@@ -28,62 +29,64 @@ class Moderator:
 
     async def warn_user(self, chat_id: int, user_id: int, reason: str = ""):
         """Выдать предупреждение"""
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        # Считаем варны
-        c.execute("""SELECT COUNT(*) FROM moderations 
-                     WHERE chat_id=? AND user_id=? AND type='warn'""",
-                  (chat_id, user_id))
-        warn_count = c.fetchone()[0] + 1
-        c.execute("""INSERT INTO moderations (chat_id, user_id, type, reason)
-                     VALUES (?, ?, 'warn', ?)""",
-                  (chat_id, user_id, reason))
-        # Если 3 варна — бан
+        def write(conn):
+            # Считаем варны
+            warn_count = conn.execute("""SELECT COUNT(*) FROM moderations 
+                                         WHERE chat_id=? AND user_id=? AND type='warn'""",
+                                      (chat_id, user_id)).fetchone()[0] + 1
+            conn.execute("""INSERT INTO moderations (chat_id, user_id, type, reason)
+                            VALUES (?, ?, 'warn', ?)""",
+                         (chat_id, user_id, reason))
+            # Если 3 варна — бан
+            if warn_count >= 3:
+                conn.execute("""INSERT INTO moderations (chat_id, user_id, type, reason)
+                                VALUES (?, ?, 'ban', '3 предупреждения')""",
+                             (chat_id, user_id))
+            return warn_count
+
+        warn_count = await db.run(write)
         if warn_count >= 3:
-            c.execute("""INSERT INTO moderations (chat_id, user_id, type, reason)
-                         VALUES (?, ?, 'ban', '3 предупреждения')""",
-                      (chat_id, user_id))
             await self.bot.ban_chat_member(chat_id, user_id)
-        conn.commit()
-        conn.close()
         return warn_count
 
     async def check_flood(self, chat_id: int, user_id: int, message_type: str = 'text'):
         """Проверка на флуд (5 стикеров/гиф подряд)"""
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""SELECT text, timestamp FROM chat_history 
-                     WHERE chat_id=? AND user_id=? 
-                     ORDER BY id DESC LIMIT 5""",
-                  (chat_id, user_id))
-        rows = c.fetchall()
-        conn.close()
-        if len(rows) < 5:
+        state = moderation_state.get(chat_id, user_id)
+        if not state or state.media_streak < FLOOD_LIMIT:
             return False
-        # Проверяем, что последние 5 сообщений — стикеры/гифы (в тексте храним тип)
-        if all('sticker' in row[0] or 'gif' in row[0] for row in rows):
-            await self.mute_user(chat_id, user_id, 5, "Флуд стикерами/гифками")
-            return True
-        return False
+        state.media_streak = 0
+        await self.mute_user(chat_id, user_id, 5, "Флуд стикерами/гифками")
+        return True
 
     async def check_spam(self, chat_id: int, user_id: int, text: str):
         """Проверка на спам одинаковыми сообщениями"""
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""SELECT text FROM chat_history 
-                     WHERE chat_id=? AND user_id=? AND text=? 
-                     ORDER BY id DESC LIMIT 3""",
-                  (chat_id, user_id, text))
-        rows = c.fetchall()
-        conn.close()
-        if len(rows) >= 3:
-            await self.mute_user(chat_id, user_id, 10, "Спам одинаковыми сообщениями")
-            return True
-        return False
+        state = moderation_state.get(chat_id, user_id)
+        if not state or not text:
+            return False
+        if state.repeats(hash(text), time.monotonic() - SPAM_WINDOW_SEC) < SPAM_REPEAT_LIMIT:
+            return False
+        state.recent.clear()
+        await self.mute_user(chat_id, user_id, 10, "Спам одинаковыми сообщениями")
+        return True
+
+    async def check_antimat(self, chat_id: int, user_id: int, text: str, message_id: int):
+        """Удаление сообщений с матом"""
+        if not profanity_filter.contains(text):
+            return False
+        metrics.inc("antimat.deleted")
+        try:
+            await self.bot.delete_message(chat_id, message_id)
+        except Exception as e:
+            logger.error(f"Не удалось удалить сообщение с матом в {chat_id}: {e}")
+        return True
 
-    async def auto_moderate(self, chat_id: int, user_id: int, text: str, message_type: str):
-        """Автомодерация: вызов всех проверок"""
-        if await self.check_flood(chat_id, user_id, message_type):
+    async def auto_moderate(self, chat_id: int, user_id: int, text: str, message_type: str,
+                            message_id: int = None, antimat: bool = False, antiflood: bool = False):
+        """Автомодерация: вызов всех проверок (без запросов к БД)"""
+        moderation_state.observe(chat_id, user_id, text, message_type)
+        if antimat and message_id and await self.check_antimat(chat_id, user_id, text, message_id):
+            return True
+        if antiflood and await self.check_flood(chat_id, user_id, message_type):
             return True
         if await self.check_spam(chat_id, user_id, text):
             return True
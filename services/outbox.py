@@ -0,0 +1,133 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from enum import IntEnum
+from aiogram.exceptions import TelegramRetryAfter
+from utils.logger import logger
+from utils.metrics import metrics
+from utils.rate_limit import TokenBucket
+from config import (OUTBOX_GLOBAL_RATE, OUTBOX_GROUP_PER_MIN, OUTBOX_PRIVATE_RATE,
+                    OUTBOX_MAX_CHATS)
+
+
+class SendPriority(IntEnum):
+    """Классы приоритета отправки: меньше — важнее"""
+    REPLY = 0    # ответы на команды
+    NOTICE = 1   # служебные уведомления создателю
+    CHAT = 2     # инициативные сообщения бота в чат (прожарка, провокации)
+    BULK = 3     # рекламные рассылки
+
+
+class Outbox:
+    """Единая очередь исходящих сообщений.
+
+    Держит общий лимит Telegram (~30 сообщений/с) и лимит на чат
+    (~20/мин в группах, ~1/с в личке). Занятый чат не задерживает
+    остальные; на RetryAfter чат ставится на паузу, отправка повторяется.
+    """
+
+    def __init__(self, rate: float = OUTBOX_GLOBAL_RATE, max_chats: int = OUTBOX_MAX_CHATS):
+        self._global = TokenBucket(rate, rate)
+        self._chats = OrderedDict()  # chat_id: TokenBucket, давно молчавшие — в начале
+        self.max_chats = max_chats
+        self._heap = []  # (priority, seq, chat_id, future)
+        self._seq = itertools.count()
+        self._timer = None
+
+    async def send(self, chat_id: int, call, priority: SendPriority = SendPriority.REPLY,
+                   retries: int = 2):
+        """Выполнить call() (корутину отправки в chat_id) в рамках лимитов"""
+        enqueued = time.perf_counter()
+        for attempt in range(retries + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                result = await call()
+            except TelegramRetryAfter as e:
+                metrics.inc("outbox.retry_after")
+                logger.warning(f"Flood wait в чате {chat_id}: {e.retry_after} с")
+                self._bucket(chat_id).pause(e.retry_after)
+                if attempt == retries:
+                    raise
+                continue
+            metrics.observe("outbox.latency_ms", (time.perf_counter() - enqueued) * 1000)
+            metrics.inc("outbox.sent")
+            return result
+
+    async def send_message(self, bot, chat_id: int, text: str,
+                           priority: SendPriority = SendPriority.CHAT, **kwargs):
+        return await self.send(chat_id, lambda: bot.send_message(chat_id, text, **kwargs), priority)
+
+    async def reply(self, message, text: str, priority: SendPriority = SendPriority.REPLY, **kwargs):
+        """message.reply через очередь"""
+        return await self.send(message.chat.id, lambda: message.reply(text, **kwargs), priority)
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:  # группы и каналы
+                bucket = TokenBucket(OUTBOX_GROUP_PER_MIN / 60, max(1, OUTBOX_GROUP_PER_MIN / 4))
+            else:
+                bucket = TokenBucket(OUTBOX_PRIVATE_RATE, max(1, OUTBOX_PRIVATE_RATE * 3))
+            self._chats[chat_id] = bucket
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire(self, chat_id: int, priority: SendPriority):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        started = time.perf_counter()
+        heapq.heappush(self._heap, (int(priority), next(self._seq), chat_id, future))
+        self._dispatch()
+        await future  # отмена просто оставляет future отменённым — он будет пропущен
+        metrics.observe("outbox.wait_ms", (time.perf_counter() - started) * 1000)
+
+    def _dispatch(self):
+        """Выпустить ожидающие отправки по приоритету, пока позволяют лимиты"""
+        heap = self._heap
+        deferred = []       # чаты, упёршиеся в свой лимит
+        wake_in = None
+        while heap:
+            global_delay = self._global.delay(1)
+            if global_delay > 0:
+                wake_in = global_delay
+                break
+            item = heapq.heappop(heap)
+            priority, seq, chat_id, future = item
+            if future.done():
+                continue
+            chat_delay = self._bucket(chat_id).delay(1)
+            if chat_delay > 0:
+                deferred.append(item)
+                wake_in = chat_delay if wake_in is None else min(wake_in, chat_delay)
+                continue
+            self._global.consume(1)
+            self._bucket(chat_id).consume(1)
+            future.set_result(None)
+        for item in deferred:
+            heapq.heappush(heap, item)
+        if wake_in is not None:
+            self._schedule(wake_in)
+        metrics.gauge("outbox.queue_depth", len(heap))
+
+    def _schedule(self, delay: float):
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._timer is not None:
+            if self._timer.when() <= when:
+                return
+            self._timer.cancel()  # нужен более ранний подъём
+
+        def wake():
+            self._timer = None
+            self._dispatch()
+
+        self._timer = loop.call_at(when, wake)
+
+
+# Глобальный экземпляр
+outbox = Outbox()
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from data.database import db
+from data.models import PROFILE_FIELDS
+from utils.metrics import metrics
+from config import PROFILE_CACHE_SIZE
+
+LIST_FIELDS = ("interests", "banned_topics")
+
+
+class ProfileStore:
+    """Анкеты ЛС: таблица personal_profiles + LRU разобранных профилей.
+
+    Вместе с профилем кэшируется готовый фрагмент системного промпта,
+    так что ответ ассистента не делает ни SQL, ни разбора. save
+    пишет в БД и сбрасывает запись кэша.
+    """
+
+    def __init__(self, max_cached: int = PROFILE_CACHE_SIZE):
+        self.max_cached = max_cached
+        self._cache = OrderedDict()  # user_id: (профиль, фрагмент промпта)
+
+    async def get(self, user_id: int) -> dict:
+        """Профиль (только заполненные поля; пустой, если анкеты нет). Не изменять результат"""
+        return (await self._entry(user_id))[0]
+
+    async def prompt(self, user_id: int) -> str:
+        """Фрагмент системного промпта с профилем пользователя"""
+        return (await self._entry(user_id))[1]
+
+    async def save(self, user_id: int, data: dict):
+        values = [_to_column(data.get(field)) for field in PROFILE_FIELDS]
+        await db.execute(f"""INSERT INTO personal_profiles (user_id, {", ".join(PROFILE_FIELDS)})
+                             VALUES (?, {", ".join("?" * len(PROFILE_FIELDS))})
+                             ON CONFLICT(user_id) DO UPDATE SET
+                                 {", ".join(f"{f}=excluded.{f}" for f in PROFILE_FIELDS)},
+                                 updated=CURRENT_TIMESTAMP""",
+                         (user_id, *values))
+        self._cache.pop(user_id, None)
+
+    async def _entry(self, user_id: int) -> tuple:
+        entry = self._cache.get(user_id)
+        if entry is not None:
+            self._cache.move_to_end(user_id)
+            metrics.inc("profiles.hits")
+            return entry
+        metrics.inc("profiles.misses")
+        row = await db.fetchone(f"SELECT {', '.join(PROFILE_FIELDS)} FROM personal_profiles WHERE user_id=?",
+                                (user_id,))
+        profile = {}
+        for field, value in zip(PROFILE_FIELDS, row or ()):
+            if value:
+                profile[field] = [v.strip() for v in value.split(",")] if field in LIST_FIELDS else value
+        entry = (profile, _render_prompt(profile))
+        self._cache[user_id] = entry
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return entry
+
+
+def _to_column(value):
+    if isinstance(value, (list, tuple)):
+        return ", ".join(value) or None
+    return value
+
+
+def _render_prompt(profile: dict) -> str:
+    def show(field, default):
+        value = profile.get(field)
+        return ", ".join(value) if isinstance(value, list) else value or default
+
+    return (f"- Язык: {show('language', 'русский')}\n"
+            f"        - Интересы: {show('interests', 'не указаны')}\n"
+            f"        - Стиль ответов: {show('style', 'нейтральный')}\n"
+            f"        - Запретные темы: {show('banned_topics', 'нет')}")
+
+
+# Глобальный экземпляр
+profile_store = ProfileStore()
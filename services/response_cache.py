@@ -0,0 +1,79 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from data.database import db
+from utils.metrics import metrics
+from config import RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_PERSIST
+
+_NON_WORD = re.compile(r"[^\w?]+")
+_SPACES = re.compile(r"\s+")
+
+
+class ResponseCache:
+    """Кэш ответов модели: LRU + TTL в памяти и (опционально) таблица response_cache"""
+
+    def __init__(self, ttl: int = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_SIZE,
+                 persistent: bool = RESPONSE_CACHE_PERSIST):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self._entries = OrderedDict()  # key: (expires, response)
+        self._writes = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Привести вопрос к каноничному виду: регистр, ё, пунктуация, пробелы"""
+        text = text.lower().replace("ё", "е")
+        text = _NON_WORD.sub(" ", text)
+        text = re.sub(r"\s*\?+", "?", text)
+        return _SPACES.sub(" ", text).strip()
+
+    def make_key(self, question: str, template: str, temperature: float) -> str:
+        normalized = self.normalize(question)
+        raw = f"{template}|{int(temperature * 10)}|{normalized}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str):
+        """Ответ из кэша или None"""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                metrics.inc("response_cache.hits")
+                return entry[1]
+            del self._entries[key]
+
+        if self.persistent:
+            row = await db.fetchone("SELECT response, expires FROM response_cache WHERE key=? AND expires>?",
+                                    (key, now))
+            if row:
+                self._remember(key, row[0], row[1])
+                metrics.inc("response_cache.hits_db")
+                return row[0]
+
+        metrics.inc("response_cache.misses")
+        return None
+
+    async def set(self, key: str, response: str):
+        expires = time.time() + self.ttl
+        self._remember(key, response, expires)
+        if not self.persistent:
+            return
+        await db.execute("INSERT OR REPLACE INTO response_cache (key, response, expires) VALUES (?, ?, ?)",
+                         (key, response, expires))
+        self._writes += 1
+        if self._writes % 100 == 0:
+            await db.execute("DELETE FROM response_cache WHERE expires<=?", (time.time(),))
+
+    def _remember(self, key: str, response: str, expires: float):
+        self._entries[key] = (expires, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        metrics.gauge("response_cache.size", len(self._entries))
+
+
+# Глобальный экземпляр
+response_cache = ResponseCache()
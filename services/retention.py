@@ -0,0 +1,116 @@
+import asyncio
+import gzip
+import json
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from data.database import db
+from services.settings import chat_settings
+from utils.logger import logger
+from utils.metrics import metrics
+from config import RETENTION_INTERVAL, RETENTION_CHUNK, RETENTION_VACUUM_PAGES, ARCHIVE_DIR
+
+
+class HistoryRetention:
+    """Фоновая архивация chat_history.
+
+    Строки старше срока хранения чата (settings.retention_days) порциями
+    дописываются в data/archive/<чат>/<дата>.jsonl.gz и удаляются из БД.
+    Каждая порция — короткая транзакция, очередь сообщений не ждёт.
+    Сначала архив, потом удаление: при сбое строка может попасть
+    в архив дважды, но не потеряется.
+    """
+
+    def __init__(self, interval: int = RETENTION_INTERVAL, chunk: int = RETENTION_CHUNK,
+                 root: str = ARCHIVE_DIR):
+        self.interval = interval
+        self.chunk = chunk
+        self.root = Path(root)
+        self._task = None
+
+    async def run_once(self) -> int:
+        """Один проход по всем чатам; вернуть число архивированных строк"""
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        total = 0
+        for chat_id, first_seen in await db.fetchall("SELECT chat_id, first_seen FROM chats"):
+            days = chat_settings.get(chat_id)["retention_days"]
+            cutoff = (now - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+            if first_seen and first_seen >= cutoff:
+                continue  # чат моложе срока хранения
+            total += await self._archive_chat(chat_id, cutoff)
+        if total:
+            await self._vacuum()
+            logger.info(f"Архивировано сообщений: {total} за {time.perf_counter() - started:.1f} с")
+        return total
+
+    async def _archive_chat(self, chat_id: int, cutoff: str) -> int:
+        archived = 0
+        while True:
+            rows = await db.fetchall("""SELECT id, user_id, text, message_type, timestamp 
+                                        FROM chat_history 
+                                        WHERE chat_id=? AND timestamp < ? 
+                                        ORDER BY timestamp LIMIT ?""",
+                                     (chat_id, cutoff, self.chunk))
+            if rows:
+                chunk_started = time.perf_counter()
+                await asyncio.to_thread(self._write_archive, chat_id, rows)
+                await db.run(_delete_rows, [(row[0],) for row in rows])
+                archived += len(rows)
+                metrics.inc("retention.archived", len(rows))
+                metrics.observe("retention.chunk_ms", (time.perf_counter() - chunk_started) * 1000)
+            if len(rows) < self.chunk:
+                return archived
+
+    def _write_archive(self, chat_id: int, rows: list):
+        """Дописать строки в файлы по датам (каждая порция — отдельный gzip-член)"""
+        by_date = defaultdict(list)
+        for row_id, user_id, text, message_type, timestamp in rows:
+            by_date[timestamp[:10]].append(json.dumps(
+                {"id": row_id, "user_id": user_id, "text": text,
+                 "type": message_type, "ts": timestamp}, ensure_ascii=False))
+        folder = self.root / str(chat_id)
+        folder.mkdir(parents=True, exist_ok=True)
+        for day, lines in by_date.items():
+            with gzip.open(folder / f"{day}.jsonl.gz", "at", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+
+    async def _vacuum(self):
+        """Вернуть освободившиеся страницы ОС, если база в режиме incremental"""
+        if await db.fetchval("PRAGMA auto_vacuum") != 2:
+            return
+        while await db.fetchval("PRAGMA freelist_count", default=0):
+            await db.run(lambda conn: conn.execute(
+                f"PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})").fetchall())
+            await asyncio.sleep(0)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка архивации истории: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Запустить фоновую архивацию"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _delete_rows(conn, ids: list):
+    conn.executemany("DELETE FROM chat_history WHERE id=?", ids)
+
+
+# Глобальный экземпляр
+history_retention = HistoryRetention()
@@ -0,0 +1,69 @@
+from datetime import date, datetime, timedelta
+from data.database import db
+from utils.logger import logger
+
+PERIODS = ("day", "week", "month", "all")
+
+
+def period_buckets(day: date) -> dict:
+    """Ключи агрегатов, в которые попадает сообщение за указанный день (UTC)"""
+    year, week, _ = day.isocalendar()
+    return {
+        "day": day.isoformat(),
+        "week": f"{year}-W{week:02d}",
+        "month": day.strftime("%Y-%m"),
+        "all": "all",
+    }
+
+
+def current_bucket(period: str) -> str:
+    return period_buckets(datetime.utcnow().date())[period]
+
+
+def write_rollups(conn, activity: dict):
+    """Прибавить прирост {(user_id, chat_id, 'YYYY-MM-DD'): n} ко всем агрегатам"""
+    rows = []
+    for (user_id, chat_id, day), count in activity.items():
+        for period, bucket in period_buckets(date.fromisoformat(day)).items():
+            rows.append((chat_id, user_id, period, bucket, count))
+    conn.executemany("""INSERT INTO activity_rollups (chat_id, user_id, period, bucket, messages)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(chat_id, period, bucket, user_id)
+                        DO UPDATE SET messages = messages + excluded.messages""", rows)
+
+
+def prune_rollups(conn, today: date):
+    """Удалить агрегаты прошедших периодов (кроме 'all')"""
+    keep = period_buckets(today - timedelta(days=1))  # вчерашний день ещё нужен до полуночи UTC
+    current = period_buckets(today)
+    for period in ("day", "week", "month"):
+        conn.execute("DELETE FROM activity_rollups WHERE period=? AND bucket NOT IN (?, ?)",
+                     (period, keep[period], current[period]))
+
+
+async def backfill_rollups():
+    """Один раз построить агрегаты из таблицы activity (для существующих БД)"""
+    if await db.fetchval("SELECT 1 FROM activity_rollups LIMIT 1"):
+        return
+    if not await db.fetchval("SELECT 1 FROM activity LIMIT 1"):
+        return
+    today = datetime.utcnow().date()
+    buckets = period_buckets(today)
+    since = {
+        "day": today,
+        "week": today - timedelta(days=today.weekday()),
+        "month": today.replace(day=1),
+    }
+
+    def build(conn):
+        conn.execute("""INSERT INTO activity_rollups (chat_id, user_id, period, bucket, messages)
+                        SELECT chat_id, user_id, 'all', 'all', SUM(messages)
+                        FROM activity GROUP BY chat_id, user_id""")
+        for period, start in since.items():
+            conn.execute("""INSERT INTO activity_rollups (chat_id, user_id, period, bucket, messages)
+                            SELECT chat_id, user_id, ?, ?, SUM(messages)
+                            FROM activity WHERE date >= ? GROUP BY chat_id, user_id""",
+                         (period, buckets[period], start.isoformat()))
+
+    await db.run(build)
+    logger.info("Агрегаты активности построены из таблицы activity")
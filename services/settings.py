@@ -0,0 +1,54 @@
+from data.database import db
+from config import HISTORY_RETENTION_DAYS
+
+# Антифлуд включён по умолчанию: раньше мут за поток стикеров/гифок работал во всех чатах
+DEFAULTS = {"antimat": False, "antiflood": True, "last_roast_message": 0,
+            "retention_days": HISTORY_RETENTION_DAYS}
+
+
+class ChatSettings:
+    """Настройки чатов: кэш в памяти + запись сквозь кэш в таблицу settings"""
+
+    def __init__(self):
+        self._cache = {}  # chat_id: dict
+
+    async def load(self):
+        """Загрузить все настройки (вызывается в on_startup)"""
+        rows = await db.fetchall("""SELECT chat_id, antimat, antiflood, last_roast_message, retention_days 
+                                    FROM settings""")
+        self._cache = {
+            chat_id: {"antimat": bool(antimat), "antiflood": bool(antiflood),
+                      "last_roast_message": last_roast or 0,
+                      "retention_days": retention or HISTORY_RETENTION_DAYS}
+            for chat_id, antimat, antiflood, last_roast, retention in rows
+        }
+
+    def get(self, chat_id: int) -> dict:
+        """Настройки чата без обращения к БД (не изменять результат)"""
+        return self._cache.get(chat_id, DEFAULTS)
+
+    async def set(self, chat_id: int, **values):
+        """Изменить настройки: сначала БД, затем кэш.
+
+        Обновляются только переданные колонки, поэтому одновременные
+        set() по разным ключам одного чата не затирают друг друга.
+        """
+        unknown = set(values) - set(DEFAULTS)
+        if unknown:
+            raise KeyError(f"Неизвестные настройки: {', '.join(unknown)}")
+        row = {**DEFAULTS, **values}  # для новой строки — остальное по умолчанию
+        columns = ", ".join(DEFAULTS)
+        updates = ", ".join(f"{key}=excluded.{key}" for key in values)
+        await db.execute(f"""INSERT INTO settings (chat_id, {columns}, updated)
+                             VALUES (?, {", ".join("?" * len(DEFAULTS))}, CURRENT_TIMESTAMP)
+                             ON CONFLICT(chat_id) DO UPDATE SET {updates}, updated=excluded.updated""",
+                         (chat_id, *(row[key] for key in DEFAULTS)))
+        # Кэш читается после записи: накладываем только свои ключи на актуальное состояние
+        self._cache[chat_id] = {**self.get(chat_id), **values}
+
+    def __len__(self):
+        return len(self._cache)
+
+
+# Глобальный экземпляр
+chat_settings = ChatSettings()
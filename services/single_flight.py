@@ -0,0 +1,37 @@
+import asyncio
+from utils.metrics import metrics
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов: пока генерация по ключу
+    идёт, все повторные вызовы ждут её результат вместо запуска своей"""
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._calls = {}  # key: asyncio.Task
+
+    async def do(self, key, fn):
+        """Выполнить fn() один раз на ключ и раздать результат всем ожидающим"""
+        task = self._calls.get(key)
+        if task is not None:
+            metrics.inc(f"{self.name}.shared")  # сэкономленный вызов модели
+        else:
+            metrics.inc(f"{self.name}.calls")
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        # shield: отмена одного ожидающего не отменяет генерацию для остальных
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # исключение уже получили ожидающие — не логировать повторно
+
+    def __contains__(self, key):
+        return key in self._calls
+
+
+# Глобальный экземпляр для генераций по (цель, чат)
+single_flight = SingleFlight()
@@ -0,0 +1,87 @@
+import re
+from utils.helpers import estimate_tokens
+from utils.metrics import metrics
+from config import TRANSCRIPT_TOKENS, TRANSCRIPT_MESSAGE_CHARS
+
+_SPACES = re.compile(r"\s+")
+
+
+def chat_transcript(messages: list, names: dict = None, budget: int = TRANSCRIPT_TOKENS,
+                    max_chars: int = TRANSCRIPT_MESSAGE_CHARS) -> str:
+    """Переписка чата для промпта: «U1: текст» по строке на сообщение.
+
+    messages — как из memory.get_chat_messages (старые -> новые).
+    Авторы заменяются короткими метками, имена (names: user_id -> имя)
+    идут одной строкой в начале. Пустые и повторные строки выкидываются,
+    при нехватке бюджета отбрасываются самые старые.
+    """
+    aliases = {}
+    lines = []
+    for msg in messages:
+        text = _clean(msg["text"], max_chars)
+        if not text:
+            continue
+        alias = aliases.setdefault(msg["user_id"], f"U{len(aliases) + 1}")
+        lines.append(f"{alias}: {text}")
+    lines = _fit(_dedup(lines), budget)
+
+    used = {line.split(":", 1)[0] for line in lines}
+    names = names or {}
+    header = ", ".join(f"{alias} — {names[user_id]}"
+                       for user_id, alias in aliases.items() if alias in used and names.get(user_id))
+    result = "\n".join(lines)
+    if header and result:
+        result = f"Участники: {header}\n{result}"
+    _report(messages, result)
+    return result
+
+
+def user_transcript(texts: list, budget: int = TRANSCRIPT_TOKENS,
+                    max_chars: int = TRANSCRIPT_MESSAGE_CHARS) -> str:
+    """Сообщения одного пользователя для промпта, по строке на сообщение.
+
+    texts — как из memory.get_user_messages (новые первыми);
+    в результате порядок хронологический.
+    """
+    lines = [_clean(text, max_chars) for text in reversed(texts)]
+    result = "\n".join(_fit(_dedup(line for line in lines if line), budget))
+    _report(texts, result)
+    return result
+
+
+def _clean(text: str, max_chars: int) -> str:
+    text = _SPACES.sub(" ", text or "").strip()
+    if len(text) > max_chars:
+        text = text[:max_chars - 1] + "…"
+    return text
+
+
+def _dedup(lines) -> list:
+    seen = set()
+    result = []
+    for line in lines:
+        if line not in seen:
+            seen.add(line)
+            result.append(line)
+    return result
+
+
+def _fit(lines: list, budget: int) -> list:
+    """Самые свежие строки, укладывающиеся в бюджет токенов"""
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        used += estimate_tokens(line)
+        if used > budget:
+            break
+        kept.append(line)
+    return kept[::-1]
+
+
+def _report(raw, result: str):
+    """Экономия относительно прежней подстановки repr() списка в промпт"""
+    before = len(repr(raw))
+    metrics.inc("transcript.chars_before", before)
+    metrics.inc("transcript.chars_after", len(result))
+    if before:
+        metrics.observe("transcript.saved_pct", 100 * (1 - len(result) / before))
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from data.database import db
+from services.ingestion import ingestor
+from utils.metrics import metrics
+from config import USER_CACHE_SIZE
+
+
+class UserDirectory:
+    """Справочник пользователей из апдейтов.
+
+    Имена кэшируются в памяти; в таблицу users уходят только новые или
+    изменившиеся записи — пакетом вместе с очередью сообщений.
+    """
+
+    def __init__(self, max_cached: int = USER_CACHE_SIZE):
+        self.max_cached = max_cached
+        self._users = OrderedDict()  # user_id: (username, first_name, last_name)
+        self._dirty = {}             # user_id: запись для upsert
+
+    def observe(self, user):
+        """Учесть пользователя из апдейта (aiogram User)"""
+        record = (user.username, user.first_name, user.last_name)
+        if self._users.get(user.id) == record:
+            self._users.move_to_end(user.id)
+            return
+        self._remember(user.id, record)
+        self._dirty[user.id] = record
+
+    def display_name(self, user_id: int):
+        """Имя из кэша или None"""
+        record = self._users.get(user_id)
+        return _format_name(record) if record else None
+
+    async def resolve(self, user_ids) -> dict:
+        """Имена для списка пользователей: кэш, недостающие — одним запросом"""
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            name = self.display_name(user_id)
+            if name:
+                names[user_id] = name
+            else:
+                missing.append(user_id)
+        if missing:
+            metrics.inc("users.cache_misses", len(missing))
+            placeholders = ",".join("?" * len(missing))
+            rows = await db.fetchall(f"""SELECT user_id, username, first_name, last_name 
+                                         FROM users WHERE user_id IN ({placeholders})""",
+                                     tuple(missing))
+            for user_id, *record in rows:
+                self._remember(user_id, tuple(record))
+                names[user_id] = _format_name(record)
+        return names
+
+    def _remember(self, user_id: int, record: tuple):
+        self._users[user_id] = record
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_cached:
+            self._users.popitem(last=False)
+
+    # === Запись пакетом (через ingestor) ===
+    def drain(self) -> list:
+        if not self._dirty:
+            return None
+        dirty, self._dirty = self._dirty, {}
+        return [(user_id, *record) for user_id, record in dirty.items()]
+
+    def write(self, conn, rows: list):
+        conn.executemany("""INSERT INTO users (user_id, username, first_name, last_name)
+                            VALUES (?, ?, ?, ?)
+                            ON CONFLICT(user_id) DO UPDATE SET
+                                username=excluded.username,
+                                first_name=excluded.first_name,
+                                last_name=excluded.last_name""", rows)
+        metrics.inc("users.upserts", len(rows))
+
+    def restore(self, rows: list):
+        for user_id, *record in rows:
+            self._dirty.setdefault(user_id, tuple(record))
+
+
+def _format_name(record) -> str:
+    username, first_name, last_name = record
+    full_name = " ".join(part for part in (first_name, last_name) if part)
+    return full_name or (f"@{username}" if username else None)
+
+
+# Глобальный экземпляр
+user_directory = UserDirectory()
+ingestor.add_sink(user_directory)
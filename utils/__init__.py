@@ -1,4 +1,5 @@
 from .logger import logger
+from .metrics import metrics
 from .helpers import *
 
-__all__ = ['logger']
\ No newline at end of file
+__all__ = ['logger', 'metrics']
\ No newline at end of file
@@ -48,6 +48,10 @@ def is_admin_command(text: str) -> bool:
                      '/антимат', '/антифлуд', '/назначить', '/посадить_в_угол']
     return any(text.startswith(cmd) for cmd in admin_commands)
 
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (~3 символа на токен для смеси ru/en)"""
+    return len(text) // 3 + 1
+
 def get_mention(user_id: int, name: str = None) -> str:
     """Получить упоминание пользователя"""
     if name:
@@ -0,0 +1,42 @@
+from collections import defaultdict
+
+
+class Metrics:
+    """Простейший реестр метрик в памяти: счётчики, гейджи и распределения"""
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self.summaries = {}  # name: [count, sum, min, max]
+
+    def inc(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        summary = self.summaries.get(name)
+        if summary is None:
+            self.summaries[name] = [1, value, value, value]
+            return
+        summary[0] += 1
+        summary[1] += value
+        summary[2] = min(summary[2], value)
+        summary[3] = max(summary[3], value)
+
+    def render(self) -> str:
+        """Текстовый отчёт для команды /metrics"""
+        lines = []
+        for name in sorted(self.counters):
+            lines.append(f"{name}: {self.counters[name]}")
+        for name in sorted(self.gauges):
+            lines.append(f"{name}: {self.gauges[name]:g}")
+        for name in sorted(self.summaries):
+            count, total, low, high = self.summaries[name]
+            lines.append(f"{name}: n={count} avg={total / count:.2f} min={low:.2f} max={high:.2f}")
+        return "\n".join(lines) or "Метрик пока нет"
+
+
+# Глобальный экземпляр
+metrics = Metrics()
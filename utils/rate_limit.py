@@ -0,0 +1,40 @@
+import time
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float = 1) -> float:
+        """Сколько секунд ждать, пока станет доступно amount токенов"""
+        self._refill()
+        amount = min(amount, self.capacity)  # крупный запрос не должен ждать вечно
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float = 1):
+        """Списать токены (баланс может уйти в минус — это долг)"""
+        self._refill()
+        self.tokens -= amount
+
+    def try_consume(self, amount: float = 1) -> bool:
+        if self.delay(amount) > 0:
+            return False
+        self.tokens -= amount
+        return True
+
+    def pause(self, seconds: float):
+        """Обнулить бакет так, чтобы следующий токен появился через seconds"""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate + 1)